@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+"""Synthetic corpus of licence pages and holders xml.
+
+Pages have the same tables as detail.php on licence.eru.cz
+(lic-header-table, lic-tez-total-table, lic-tez-header-table,
+lic-tez-data-table) including the inconsistencies the parser has to
+handle: total table identified by id or by class, values in <th>
+instead of <td>, missing address or cadastre, cancelled licences
+without capacities. Number of facilities follows a long tail, most
+licences have one, a few have dozens.
+
+Holders xml has every attribute of holders.main.translation.
+
+    python -m benchmarks.corpus --count 100000 --output corpus
+"""
+
+import argparse
+import random
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+from holders.main import business_map, translation
+
+
+KRAJE = {
+    'Hlavní město Praha': ['Hlavní město Praha'],
+    'Středočeský': ['Beroun', 'Kladno', 'Kolín', 'Mělník', 'Nymburk'],
+    'Jihočeský': ['České Budějovice', 'Písek', 'Tábor'],
+    'Plzeňský': ['Plzeň-město', 'Plzeň-jih', 'Klatovy'],
+    'Karlovarský': ['Cheb', 'Karlovy Vary', 'Sokolov'],
+    'Ústecký': ['Ústí nad Labem', 'Most', 'Chomutov', 'Louny'],
+    'Liberecký': ['Liberec', 'Jablonec nad Nisou', 'Česká Lípa'],
+    'Královéhradecký': ['Hradec Králové', 'Trutnov', 'Náchod'],
+    'Pardubický': ['Pardubice', 'Chrudim', 'Svitavy'],
+    'Vysočina': ['Havlíčkův Brod', 'Jihlava', 'Třebíč'],
+    'Jihomoravský': ['Brno-město', 'Břeclav', 'Hodonín', 'Znojmo'],
+    'Olomoucký': ['Olomouc', 'Prostějov', 'Šumperk'],
+    'Zlínský': ['Zlín', 'Kroměříž', 'Vsetín'],
+    'Moravskoslezský': ['Ostrava-město', 'Karviná', 'Opava', 'Frýdek-Místek'],
+}
+
+OBCE = [
+    'Lipnice nad Sázavou', 'Hořovice', 'Klatovy', 'Oleška', 'Kněžice',
+    'Trmice', 'Ledvice', 'Dětmarovice', 'Plzeň', 'Tisová', 'Vřesová',
+]
+
+ULICE = ['Komenského', 'Jateční', 'Edisonova', 'Tylova', 'Nádražní', 'Husova']
+
+TECHNOLOGIE_EL = ['Parní', 'Vodní', 'Sluneční', 'Větrná', 'Spalovací', 'Paroplynová']
+TECHNOLOGIE_TEP = ['Parní', 'Horkovodní', 'Teplovodní']
+
+STATUSY = ['Aktivní verze', 'Aktivní verze', 'Aktivní verze', 'Zaniklá', 'Zrušena']
+
+LIC_ID_START = 110100000
+
+
+def facility_count(rng: random.Random) -> int:
+    """Long tail, most licences have one facility.
+    """
+    if rng.random() < 0.85:
+        return 1
+    return min(int(rng.paretovariate(1.2)) + 1, 80)
+
+
+def _capacity_table(
+    rng: random.Random, attrs: str, sources: int, extra_rows: List[str]
+        ) -> str:
+    technologie = rng.sample(TECHNOLOGIE_EL, rng.randint(1, 2))
+    rows = {t: (round(rng.uniform(0.005, 500), 3), 0.0) for t in technologie}
+    if rng.random() < 0.3:
+        tep = rng.choice(TECHNOLOGIE_TEP)
+        el, _ = rows.get(tep, (0.0, 0.0))
+        rows[tep] = (el, round(rng.uniform(0.1, 300), 3))
+
+    total_el = sum(el for el, _ in rows.values())
+    total_tep = sum(tep for _, tep in rows.values())
+
+    def value(mw: float) -> str:
+        if not mw:
+            return ''
+        # Thousands are separated by space on the website
+        return f'{mw:,.3f}'.replace(',', ' ')
+
+    def row(name: str, el: float, tep: float) -> str:
+        # Sometimes the value is in <th> instead of <td>
+        first = 'th' if rng.random() < 0.1 else 'td'
+        return (
+            f'<tr><th>{name}</th><{first}>{value(el)}</{first}>'
+            f'<td>{value(tep)}</td></tr>'
+            )
+
+    parts = [
+        f'<table {attrs}>',
+        '<tr><th colspan="3">Rozsah podnikání</th></tr>',
+        '<tr><td></td><th>Elektrický [MW]</th><th>Tepelný [MW]</th></tr>',
+        row('Celkový', total_el, total_tep),
+        ]
+    parts.extend(row(name, el, tep) for name, (el, tep) in rows.items())
+    parts.append(f'<tr><th>Počet zdrojů</th><td>{sources}</td></tr>')
+    parts.extend(extra_rows)
+    parts.append('</table>')
+    return '\n'.join(parts)
+
+
+def _facility(rng: random.Random, number: int) -> str:
+    kraj = rng.choice(list(KRAJE))
+    okres = rng.choice(KRAJE[kraj])
+    obec = rng.choice(OBCE)
+    psc = f'{rng.randint(100, 799)} {rng.randint(0, 99):02d}'
+
+    divs = [
+        f'<div>Evidenční číslo: {number}</div>',
+        f'<div>{rng.choice(["Elektrárna", "MVE", "FVE", "Bioplynová stanice"])} {obec} {number}</div>',
+        ]
+    if rng.random() < 0.95:  # Adresa někdy schází
+        if rng.random() < 0.5:
+            ulice = f'{rng.choice(ULICE)}\xa0{rng.randint(1, 3000)}/{rng.randint(1, 40)}'
+        else:
+            ulice = obec
+        kraj_part = f',\xa0\n\t\t\t\t\t\tkraj {kraj}' if rng.random() < 0.9 else ''
+        divs.append(
+            f'<div>{psc}\xa0{obec},\xa0\n\t\t\t\t\t\t{ulice},\xa0\n\t\t\t\t\t\t'
+            f'okres {okres}{kraj_part}</div>'
+            )
+
+    rows = [f'<tr><td colspan="4">{"".join(divs)}</td></tr>']
+    if rng.random() < 0.9:  # Informace o katastru někdy schází
+        rows.append(
+            '<tr><th>Katastrální území</th><th>Kód katastru</th>'
+            '<th>Vymezení</th></tr>'
+            )
+        rows.append(
+            f'<tr><td>{obec}</td><td>{rng.randint(600000, 799999)}</td>'
+            f'<td>parc. č. {rng.randint(1, 2000)}</td></tr>'
+            )
+
+    header = (
+        '<table class="lic-tez-header-table">\n' + '\n'.join(rows) + '\n</table>'
+        )
+
+    extra_rows = []
+    if rng.random() < 0.1:
+        extra_rows.append(f'<tr><th>Tok</th><td>{rng.choice(["Vltava", "Oleška", "Labe"])}</td></tr>')
+        extra_rows.append(f'<tr><th>Říční km</th><td>{rng.uniform(0, 300):.1f}</td></tr>')
+    data = _capacity_table(
+        rng, 'class="lic-tez-data-table"', rng.randint(1, 6), extra_rows,
+        )
+
+    return header + '\n' + data
+
+
+def generate_page(
+    lic_id: str, rng: random.Random, facilities: Optional[int] = None,
+        ) -> bytes:
+    """Page of one licence as returned by detail.php?lic-id=lic_id.
+
+    Without facilities the number is random and some licences
+    are cancelled (no capacities at all).
+    """
+    parts = [
+        '<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8">'
+        f'<title>Licence {lic_id}</title></head>\n<body>',
+        '<table id="lic-header-table">'
+        f'<tr><th>Číslo licence</th><td>{lic_id}</td></tr>'
+        f'<tr><th>Verze licence</th><td>{rng.randint(1, 20)}</td></tr>'
+        '</table>',
+        ]
+
+    # Zrušené a zaniklé licence nemají výkony ani provozovny
+    if facilities is None and rng.random() < 0.92:
+        facilities = facility_count(rng)
+    if facilities:
+        attrs = rng.choice([
+            'class="lic-tez-total-table"', 'id="lic-tez-total-table"',
+            ])
+        parts.append(_capacity_table(rng, attrs, facilities, []))
+        parts.extend(_facility(rng, number) for number in range(1, facilities + 1))
+
+    parts.append('</body>\n</html>')
+    return '\n'.join(parts).encode('utf-8')
+
+
+def lic_ids(count: int) -> List[str]:
+    return [str(LIC_ID_START + i) for i in range(count)]
+
+
+def _holder_attrs(lic_id: str, rng: random.Random) -> dict:
+    status = rng.choice(STATUSY)
+    active = status == 'Aktivní verze'
+    kraj = rng.choice(list(KRAJE))
+    start = date(2001, 1, 1) + timedelta(days=rng.randint(0, 7000))
+
+    def fluff(value):
+        return value if active else '-----'
+
+    return {
+        'cislo_licence': lic_id,
+        'version': str(rng.randint(1, 20)) if active else '',
+        'version_status': status,
+        'subjekt_IC': fluff(f'{rng.randint(10000000, 99999999)}'),
+        'subjekt_nazev': fluff(f'{rng.choice(OBCE)} energie, s.r.o.'),
+        'subjekt_cislo_dom': fluff(str(rng.randint(1, 3000))),
+        'subjekt_cislo_or': fluff(str(rng.randint(1, 40))),
+        'subjekt_ulice_nazev': fluff(rng.choice(ULICE)),
+        'subjekt_obec_cast': fluff(rng.choice(OBCE)),
+        'subjekt_obec_nazev': fluff(rng.choice(OBCE)),
+        'subjekt_PSC': fluff(f'{rng.randint(100, 799)} {rng.randint(0, 99):02d}'),
+        'subjekt_okres': fluff(rng.choice(KRAJE[kraj])),
+        'subjekt_kraj': fluff(kraj),
+        'subjekt_zeme': fluff('CZ'),
+        'subjekt_den_opravneni': start.isoformat(),
+        'subjekt_den_zahajeni': start.isoformat(),
+        'subjekt_den_zaniku': (start + timedelta(days=25 * 365)).isoformat(),
+        'subjekt_den_nabyti_pravni_moci': start.isoformat(),
+        'odpovedny_zast': 'Yvona Křáková' if active else '',
+    }
+
+
+def iter_xml(count: int, rng: random.Random) -> Iterator[bytes]:
+    """Holders xml in cp1250 as on eru.cz, yielded in chunks.
+    """
+    yield b'<?xml version="1.0" encoding="windows-1250"?>\n<licences>\n'
+    for lic_id in lic_ids(count):
+        attrs = _holder_attrs(lic_id, rng)
+        assert set(attrs) == set(translation)
+        row = ' '.join(f'{k}={quoteattr(v)}' for k, v in attrs.items())
+        yield f'<licence {row}/>\n'.encode('cp1250')
+    yield b'</licences>\n'
+
+
+def generate_xml(count: int, rng: random.Random) -> bytes:
+    return b''.join(iter_xml(count, rng))
+
+
+def write_corpus(
+    output: Path, count: int, seed: int = 0, business: str = 'electricity',
+        ) -> Tuple[Path, Path]:
+    """Write holders xml and pages of count licences to output.
+
+    Pages are in output/pages/<lic-id>.html, xml in
+    output/holders/<business>.xml. Same seed gives the same corpus.
+    """
+    rng = random.Random(seed)
+
+    xml_path = output / 'holders' / f'{business}.xml'
+    xml_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(xml_path, 'wb') as f:
+        f.writelines(iter_xml(count, rng))
+
+    pages_dir = output / 'pages'
+    pages_dir.mkdir(parents=True, exist_ok=True)
+    for lic_id in lic_ids(count):
+        (pages_dir / f'{lic_id}.html').write_bytes(generate_page(lic_id, rng))
+
+    return xml_path, pages_dir
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='corpus',
+        description='Generates synthetic licence pages and holders xml',
+    )
+
+    parser.add_argument(
+        '--count',
+        default=1000,
+        type=int,
+        help='number of licences (default: 1000)'
+    )
+
+    parser.add_argument(
+        '--output',
+        metavar='DIRECTORY',
+        default='corpus',
+        help='output directory (default: corpus)'
+    )
+
+    parser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        help='seed of random generator (default: 0)'
+    )
+
+    parser.add_argument(
+        '--business',
+        action='store',
+        choices=list(business_map),
+        default='electricity',
+        help='name of the holders xml (default: electricity)'
+    )
+
+    return parser
+
+
+def main() -> None:
+    args = vars(get_parser().parse_args())
+    xml_path, pages_dir = write_corpus(
+        Path(args['output']), args['count'], args['seed'], args['business'],
+        )
+    print(f'Holders xml: {xml_path}')
+    print(f'{args["count"]} pages in {pages_dir}')
+
+
+if __name__ == '__main__':
+    main()
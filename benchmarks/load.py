@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""Load test of the whole download against benchmarks.server.
+
+Starts the server on a free port (or uses --url of a running one),
+downloads and parses holders xml for the licence ids, then runs
+licenses.pipeline.stream over them at every concurrency level
+and prints licences per second with the statuses the server sent
+and medians of fetch, decode and parse from common.metrics.
+
+    python -m benchmarks.load --count 2000 --concurrency 1,4,16,32
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import List
+
+from benchmarks import corpus, server
+from common import client, metrics
+from common.limiter import AdaptiveLimiter
+from holders import main as holders_main
+from licenses import pipeline
+
+
+def holder_ids(index_url: str, business: str) -> List[str]:
+    start = time.perf_counter()
+    xml = holders_main.get_xml(index_url, holders_main.business_map[business])
+    with holders_main.open_xml(xml) as (stream, encoding):
+        ids = [
+            holder.id for holder in
+            holders_main.iter_xml(stream, holders_main.business_map[business], encoding)
+            ]
+    elapsed = time.perf_counter() - start
+    print(f'Holders xml: {len(ids)} licences in {elapsed:.2f} s')
+    return ids
+
+
+def run_level(
+    lic_ids: List[str], url: str, concurrency: int, parse_workers: int,
+    backend: str, max_rps: float,
+        ) -> dict:
+    """Download and parse all licences, return count, time and error.
+    """
+    count = 0
+    error = None
+    start = time.perf_counter()
+    try:
+        for _ in pipeline.stream(
+            'výroba elektřiny', lic_ids, url, concurrency=concurrency,
+            parse_workers=parse_workers, backend=backend,
+            limiter=AdaptiveLimiter(concurrency, max_rps),
+                ):
+            count += 1
+    except SystemExit as e:
+        error = str(e) or 'request failed'
+    return {'count': count, 'seconds': time.perf_counter() - start, 'error': error}
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='load',
+        description='Measures licences per second against local server',
+    )
+
+    parser.add_argument(
+        '--corpus',
+        metavar='DIRECTORY',
+        default='corpus',
+        help='corpus directory, generated if missing (default: corpus)'
+    )
+
+    parser.add_argument(
+        '--count',
+        default=1000,
+        type=int,
+        help='number of licences in generated corpus (default: 1000)'
+    )
+
+    parser.add_argument(
+        '--url',
+        default=None,
+        help='base url of a running benchmarks.server instead of starting one (default: None)'
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        default='1,4,16,32',
+        help='comma separated concurrency levels (default: 1,4,16,32)'
+    )
+
+    parser.add_argument(
+        '--parse-workers',
+        default=1,
+        type=int,
+        help='number of processes parsing pages (default: 1)'
+    )
+
+    parser.add_argument(
+        '--backend',
+        choices=['bs4', 'lxml'],
+        default='bs4',
+        help='parser of licence pages (default: bs4)'
+    )
+
+    parser.add_argument(
+        '--max-rps',
+        default=0,
+        type=float,
+        help='ceiling of requests per second, 0 for none (default: 0)'
+    )
+
+    server.add_fault_arguments(parser)
+
+    return parser
+
+
+def main() -> None:
+    args = vars(get_parser().parse_args())
+    levels = [int(level) for level in args['concurrency'].split(',')]
+
+    corpus_dir = Path(args['corpus'])
+    if not (corpus_dir / 'holders' / 'electricity.xml').exists():
+        print(f'Generating corpus of {args["count"]} licences in {corpus_dir}')
+        corpus.write_corpus(corpus_dir, args['count'])
+
+    local = None
+    url = args['url']
+    if url is None:
+        local = server.CorpusServer(
+            ('127.0.0.1', 0), corpus_dir, server.faults_from_args(args),
+            )
+        server.serve_in_thread(local)
+        url = local.url
+
+    # One connection for every request in flight
+    client.reset_session(max(levels))
+
+    try:
+        lic_ids = holder_ids(url + server.INDEX_PATH, 'electricity')
+
+        print(f'{"concurrency":>12}{"licences":>10}{"seconds":>10}{"lic/s":>10}  statuses')
+        for level in levels:
+            if local:
+                local.reset_stats()
+            metrics.registry.reset()
+            result = run_level(
+                lic_ids, url + '/detail.php', level, args['parse_workers'],
+                args['backend'], args['max_rps'],
+                )
+            statuses = dict(local.reset_stats()) if local else {}
+            rate = result['count'] / result['seconds'] if result['seconds'] else 0
+            print(
+                f'{level:>12}{result["count"]:>10}{result["seconds"]:>10.2f}'
+                f'{rate:>10.1f}  {statuses}'
+                + (f'  failed: {result["error"]}' if result['error'] else '')
+                )
+            histograms = metrics.registry.snapshot()['histograms']
+            print(' ' * 12 + '  '.join(
+                f'{stage} p50 {histograms[stage]["p50"] * 1000:g} ms'
+                for stage in ('fetch_seconds', 'decode_seconds', 'parse_seconds')
+                if stage in histograms
+                ) + f'  limit {metrics.registry.gauges.get(("limiter_limit", ()), 0):.1f}')
+    finally:
+        if local:
+            local.shutdown()
+            local.server_close()
+
+
+if __name__ == '__main__':
+    main()
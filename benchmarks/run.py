@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+"""Offline benchmarks of parsing and output hot paths.
+
+Measures parse.parse_page (both backends) and the legacy
+old.parsuj.parsuj_stranku on every sample page, holders.main.parse_xml
+on synthetic xml from benchmarks.corpus, address parsing and csv
+output of thousands of licences. Nothing is requested from the network.
+
+Every run is appended to a json history. A benchmark whose best time
+is slower than the best of the previous runs times threshold
+is reported as a regression and the script exits with status 1.
+
+    python -m benchmarks.run [--quick] [--threshold 1.25] [--filter parse]
+"""
+
+import argparse
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from benchmarks import corpus
+from holders import main as holders_main
+from licenses import address, parse, pipeline
+from licenses.output import CsvWriter
+
+
+SAMPLES = Path('samples')
+SAMPLE_PAGES = ('plzen.html', 'oleska.html', 'cenergyplana.html', 'cez.html')
+HISTORY = Path('benchmarks/results/history.json')
+
+# Runs compared with the current one
+BASELINE_RUNS = 5
+
+# Synthetic inputs are the same in every run
+SEED = 0
+
+
+def pages() -> Dict[str, bytes]:
+    result = {}
+    for name in SAMPLE_PAGES:
+        path = SAMPLES / name
+        if path.exists():
+            result[name] = path.read_bytes()
+    rng = random.Random(SEED)
+    result['synthetic-27.html'] = corpus.generate_page('110100000', rng, 27)
+    return result
+
+
+def benchmarks(quick: bool) -> Dict[str, Callable[[], None]]:
+    """Name and function of every benchmark.
+    """
+    from bs4 import BeautifulSoup
+    from old import parsuj
+
+    cases = {}
+
+    for name, content in pages().items():
+        cases[f'parse_page[bs4,{name}]'] = (
+            lambda c=content: pipeline.parse_content('výroba elektřiny', '1', c, 'bs4')
+            )
+        try:
+            import lxml  # noqa: F401
+            cases[f'parse_page[lxml,{name}]'] = (
+                lambda c=content: pipeline.parse_content('výroba elektřiny', '1', c, 'lxml')
+                )
+        except ImportError:
+            pass
+        cases[f'legacy_parsuj_stranku[{name}]'] = (
+            lambda c=content: parsuj.parsuj_stranku(BeautifulSoup(c, 'html.parser'))
+            )
+
+    for count in (1000,) if quick else (1000, 20000):
+        xml = corpus.generate_xml(count, random.Random(SEED))
+        cases[f'parse_xml[{count}]'] = (
+            lambda x=xml: list(holders_main.iter_xml(io.BytesIO(x), 'výroba elektřiny'))
+            )
+
+    # 1000 addresses, 50 of them distinct as many facilities share them
+    adresy = [
+        f'301 {i % 50:02d}\xa0Obec {i % 50},\xa0\n\t\tUlice\xa0{i % 50}/7,'
+        '\xa0\n\t\tokres Plzeň-město,\xa0\n\t\tkraj Plzeňský'
+        for i in range(1000)
+        ]
+
+    def rozdel_adresu_uncached():
+        for adresa in adresy:
+            address.rozdel_adresu(address.uprav_adresu(adresa))
+
+    cases['rozdel_adresu[1000]'] = rozdel_adresu_uncached
+    cases['zpracuj_adresy[1000]'] = lambda: address.zpracuj_adresy(adresy)
+
+    count = 500 if quick else 5000
+    lic = parse.parse_page(
+        'výroba elektřiny', '1',
+        parse.make_soup(corpus.generate_page('110100000', random.Random(SEED), 3)),
+        )
+
+    def csv_writer():
+        with tempfile.TemporaryDirectory() as tmp:
+            with CsvWriter(Path(tmp)) as writer:
+                for _ in range(count):
+                    writer.write(lic)
+
+    def legacy_to_csv():
+        with tempfile.TemporaryDirectory() as tmp:
+            for _ in range(count):
+                super(parse.Licence, lic).to_csv(Path(tmp), 'licenses.csv')
+                for cap in lic.vykony:
+                    cap.to_csv(Path(tmp), 'capacities.csv')
+                for fac in lic.provozovny:
+                    fac.to_csv(Path(tmp), 'facilities.csv')
+                    for fac_cap in fac.vykony:
+                        fac_cap.to_csv(Path(tmp), 'facilities_capacities.csv')
+
+    cases[f'csv_writer[{count}]'] = csv_writer
+    cases[f'per_row_to_csv[{count}]'] = legacy_to_csv
+
+    return cases
+
+
+def measure(func: Callable[[], None], repeat: int, min_time: float) -> dict:
+    """Best and median time of one call in seconds.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 16:
+            break
+        number *= 2
+
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+
+    return {'min': min(times), 'median': statistics.median(times), 'number': number}
+
+
+def load_history(path: Path) -> List[dict]:
+    try:
+        return json.loads(path.read_text())['runs']
+    except FileNotFoundError:
+        return []
+
+
+def regressions(
+    results: Dict[str, dict], history: List[dict], threshold: float
+        ) -> List[str]:
+    """Benchmarks slower than the best of the last runs times threshold.
+    """
+    slower = []
+    for name, result in results.items():
+        previous = [
+            run['results'][name]['min'] for run in history[-BASELINE_RUNS:]
+            if name in run['results']
+            ]
+        if previous and result['min'] > min(previous) * threshold:
+            slower.append(
+                f'{name}: {result["min"] * 1000:.3f} ms, '
+                f'baseline {min(previous) * 1000:.3f} ms'
+                )
+    return slower
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='benchmarks',
+        description='Offline benchmarks of parsing and csv output',
+    )
+
+    parser.add_argument(
+        '--quick',
+        action='store_true',
+        default=False,
+        help='smaller inputs and fewer repeats (default: False)'
+    )
+
+    parser.add_argument(
+        '--filter',
+        metavar='TEXT',
+        default='',
+        help='run only benchmarks whose name contains TEXT'
+    )
+
+    parser.add_argument(
+        '--threshold',
+        default=1.25,
+        type=float,
+        help='slowdown against history reported as regression (default: 1.25)'
+    )
+
+    parser.add_argument(
+        '--history',
+        metavar='FILENAME',
+        default=str(HISTORY),
+        help=f'json file with results of previous runs (default: {HISTORY})'
+    )
+
+    parser.add_argument(
+        '--no-save',
+        action='store_true',
+        default=False,
+        help='do not append this run to history (default: False)'
+    )
+
+    return parser
+
+
+def main() -> None:
+    args = vars(get_parser().parse_args())
+
+    repeat = 3 if args['quick'] else 7
+    min_time = 0.05 if args['quick'] else 0.2
+
+    results = {}
+    for name, func in benchmarks(args['quick']).items():
+        if args['filter'] not in name:
+            continue
+        results[name] = measure(func, repeat, min_time)
+        print(f'{name:<48}{results[name]["min"] * 1000:>12.3f} ms')
+
+    history_path = Path(args['history'])
+    history = load_history(history_path)
+    slower = regressions(results, history, args['threshold'])
+
+    if not args['no_save']:
+        history.append({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        })
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        history_path.write_text(json.dumps({'runs': history}, indent=1))
+
+    if slower:
+        print('\nRegressions:')
+        for line in slower:
+            print(line)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+
+"""Local stand-in for eru.cz and licence.eru.cz.
+
+Serves a corpus written by benchmarks.corpus:
+
+    /licence/informace-o-drzitelich    index page with links to xml
+    /holders/<business>.xml            holders xml
+    /detail.php?lic-id=<lic-id>        licence page
+
+Every response can be delayed (lognormal latency), fail with 500,
+be throttled with 429 and Retry-After (randomly or above capacity
+requests per second) or have a slow body sent at limited bandwidth.
+Pages have ETag, so conditional requests of licenses.cache get 304.
+
+    python -m benchmarks.server --corpus corpus --port 8000 --error-rate 0.01
+"""
+
+import argparse
+import math
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from holders.main import business_map
+
+
+INDEX_PATH = '/licence/informace-o-drzitelich'
+
+# Size of chunks of slow bodies
+SLOW_CHUNK = 4096
+
+
+@dataclass
+class Faults:
+    """Latency and fault injection of the server.
+
+    latency is the median delay of a response in seconds and jitter
+    the sigma of its lognormal distribution, rates are probabilities
+    of a response. With capacity requests over capacity per second
+    get 429 like from a rate limited server.
+    """
+
+    latency: float = 0.02
+    jitter: float = 0.5
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+    slow_rate: float = 0.0
+    slow_bandwidth: int = 64 * 1024
+    capacity: float = 0.0
+
+
+class CorpusServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, corpus: Path, faults: Faults, seed: int = 0):
+        super().__init__(address, Handler)
+        self.corpus = Path(corpus)
+        self.faults = faults
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # Token bucket of capacity, holds one second of requests
+        self._tokens = faults.capacity
+        self._refilled = time.monotonic()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def delay(self) -> float:
+        faults = self.faults
+        if faults.latency <= 0:
+            return 0.0
+        with self._lock:
+            return self._rng.lognormvariate(math.log(faults.latency), faults.jitter)
+
+    def over_capacity(self) -> bool:
+        capacity = self.faults.capacity
+        if capacity <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._tokens + (now - self._refilled) * capacity, capacity,
+                )
+            self._refilled = now
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+            return False
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def reset_stats(self) -> Counter:
+        with self._lock:
+            stats, self.stats = self.stats, Counter()
+        return stats
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, do not wait for ack
+    disable_nagle_algorithm = True
+    server: CorpusServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        faults = self.server.faults
+
+        if self.server.over_capacity() or self.server.random() < faults.throttle_rate:
+            self.server.count('429')
+            self.send_empty(429, {'Retry-After': str(faults.retry_after)})
+            return
+
+        time.sleep(self.server.delay())
+
+        if self.server.random() < faults.error_rate:
+            self.server.count('500')
+            self.send_empty(500)
+            return
+
+        if url.path == INDEX_PATH:
+            self.send_body(self.index_page(), 'text/html; charset=utf-8')
+        elif url.path.startswith('/holders/') and url.path.endswith('.xml'):
+            self.send_file(
+                self.server.corpus / 'holders' / Path(url.path).name,
+                'text/xml; charset=windows-1250',
+                )
+        elif url.path == '/detail.php':
+            lic_id = parse_qs(url.query).get('lic-id', [''])[0]
+            self.send_file(
+                self.server.corpus / 'pages' / f'{Path(lic_id).name}.html',
+                'text/html; charset=utf-8',
+                )
+        else:
+            self.server.count('404')
+            self.send_empty(404)
+
+    def index_page(self) -> bytes:
+        links = [
+            f'<li><a href="/holders/{path.name}">{business_map[path.stem]}</a></li>'
+            for path in sorted((self.server.corpus / 'holders').glob('*.xml'))
+            if path.stem in business_map
+            ]
+        return (
+            '<html><body><ul>' + ''.join(links) + '</ul></body></html>'
+            ).encode('utf-8')
+
+    def send_file(self, path: Path, content_type: str) -> None:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self.server.count('404')
+            self.send_empty(404)
+            return
+
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.server.count('304')
+            self.send_empty(304, {'ETag': etag})
+            return
+
+        self.send_body(path.read_bytes(), content_type, {'ETag': etag})
+
+    def send_body(
+        self, body: bytes, content_type: str, headers: Optional[dict] = None,
+            ) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+
+        faults = self.server.faults
+        if self.server.random() < faults.slow_rate:
+            self.server.count('200 slow')
+            for i in range(0, len(body), SLOW_CHUNK):
+                self.wfile.write(body[i:i + SLOW_CHUNK])
+                self.wfile.flush()
+                time.sleep(SLOW_CHUNK / faults.slow_bandwidth)
+        else:
+            self.server.count('200')
+            self.wfile.write(body)
+
+    def send_empty(self, status: int, headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+
+
+def serve_in_thread(server: CorpusServer) -> threading.Thread:
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = Faults()
+
+    parser.add_argument(
+        '--latency',
+        default=defaults.latency,
+        type=float,
+        help=f'median latency of a response in seconds (default: {defaults.latency})'
+    )
+
+    parser.add_argument(
+        '--jitter',
+        default=defaults.jitter,
+        type=float,
+        help=f'sigma of lognormal latency (default: {defaults.jitter})'
+    )
+
+    parser.add_argument(
+        '--error-rate',
+        default=defaults.error_rate,
+        type=float,
+        help=f'share of responses with status 500 (default: {defaults.error_rate})'
+    )
+
+    parser.add_argument(
+        '--throttle-rate',
+        default=defaults.throttle_rate,
+        type=float,
+        help=f'share of responses with status 429 (default: {defaults.throttle_rate})'
+    )
+
+    parser.add_argument(
+        '--retry-after',
+        default=defaults.retry_after,
+        type=int,
+        help=f'Retry-After of 429 responses in seconds (default: {defaults.retry_after})'
+    )
+
+    parser.add_argument(
+        '--slow-rate',
+        default=defaults.slow_rate,
+        type=float,
+        help=f'share of responses with slow body (default: {defaults.slow_rate})'
+    )
+
+    parser.add_argument(
+        '--capacity',
+        default=defaults.capacity,
+        type=float,
+        help='requests per second served, 429 for the rest, 0 for no limit '
+             f'(default: {defaults.capacity})'
+    )
+
+    parser.add_argument(
+        '--slow-bandwidth',
+        default=defaults.slow_bandwidth,
+        type=int,
+        help=f'bytes per second of slow bodies (default: {defaults.slow_bandwidth})'
+    )
+
+
+def faults_from_args(args: dict) -> Faults:
+    return Faults(
+        latency=args['latency'],
+        jitter=args['jitter'],
+        error_rate=args['error_rate'],
+        throttle_rate=args['throttle_rate'],
+        retry_after=args['retry_after'],
+        slow_rate=args['slow_rate'],
+        slow_bandwidth=args['slow_bandwidth'],
+        capacity=args['capacity'],
+    )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='server',
+        description='Serves synthetic corpus like eru.cz with injected faults',
+    )
+
+    parser.add_argument(
+        '--corpus',
+        metavar='DIRECTORY',
+        default='corpus',
+        help='directory written by benchmarks.corpus (default: corpus)'
+    )
+
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='address to listen on (default: 127.0.0.1)'
+    )
+
+    parser.add_argument(
+        '--port',
+        default=8000,
+        type=int,
+        help='port to listen on (default: 8000)'
+    )
+
+    add_fault_arguments(parser)
+
+    return parser
+
+
+def main() -> None:
+    args = vars(get_parser().parse_args())
+    server = CorpusServer(
+        (args['host'], args['port']), args['corpus'], faults_from_args(args),
+        )
+    print(f'Holders index at {server.url}{INDEX_PATH}')
+    print(f'Licences at {server.url}/detail.php')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
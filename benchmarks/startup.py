@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Startup time of the command line apps.
+
+Every command runs in a fresh interpreter several times, the best
+and median wall time are printed next to an empty interpreter
+as a baseline. Commands run in a temporary directory with a small
+holders csv, so licenses --count has something to count.
+
+Modules which slow down startup (requests, bs4, asyncio, ...) must be
+imported only by commands which need them. If importing the apps
+pulls any of them in, the script names them and exits with status 1.
+
+    python -m benchmarks.startup [--repeat 20]
+"""
+
+import argparse
+import csv
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+    'python': ['-c', 'pass'],
+    'import licenses.main': ['-c', 'import licenses.main'],
+    'import holders.main': ['-c', 'import holders.main'],
+    'licenses --count': ['-m', 'licenses.main', '--count'],
+    'licenses --help': ['-m', 'licenses.main', '--help'],
+    'holders --help': ['-m', 'holders.main', '--help'],
+}
+
+HEAVY_MODULES = (
+    'requests', 'urllib3', 'bs4', 'lxml', 'asyncio', 'multiprocessing',
+    'numpy', 'pyarrow',
+)
+
+
+def environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [str(ROOT), env.get('PYTHONPATH')])
+        )
+    return env
+
+
+def write_holders(directory: Path, count: int = 100) -> None:
+    path = directory / 'csvs' / 'holders' / 'electricity' / 'holders.csv'
+    path.parent.mkdir(parents=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'nazev'])
+        for i in range(count):
+            writer.writerow([str(110100000 + i), f'Holder {i}'])
+
+
+def measure(args: List[str], cwd: Path, env: dict, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args], cwd=cwd, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False,
+            )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def heavy_imports(cwd: Path, env: dict) -> List[str]:
+    """Heavy modules imported by importing both apps.
+    """
+    code = (
+        'import sys, holders.main, licenses.main; '
+        f'print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=cwd, env=env,
+        capture_output=True, text=True, check=True,
+        )
+    return result.stdout.split()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='startup',
+        description='Measures startup time of licenses and holders',
+    )
+
+    parser.add_argument(
+        '--repeat',
+        default=20,
+        type=int,
+        help='runs of every command (default: 20)'
+    )
+
+    return parser
+
+
+def main() -> None:
+    args = vars(get_parser().parse_args())
+    env = environment()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = Path(tmp)
+        write_holders(cwd)
+
+        print(f'{"command":<24}{"best ms":>10}{"median ms":>12}')
+        for name, command in COMMANDS.items():
+            times = measure(command, cwd, env, args['repeat'])
+            print(
+                f'{name:<24}{min(times) * 1000:>10.1f}'
+                f'{statistics.median(times) * 1000:>12.1f}'
+                )
+
+        heavy = heavy_imports(cwd, env)
+
+    if heavy:
+        print(f'Imported at startup: {", ".join(heavy)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""Shared HTTP client for the Energy Regulatory Office websites.
+
+Both holders and licenses send their requests through one
+requests.Session, so connections are pooled and kept alive
+between requests instead of opened again for every licence.
+Pool size and timeouts are read from config.ini [http].
+
+requests is imported with the first session, commands which do not
+download anything start without it.
+"""
+
+import threading
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from common.config import get_config
+
+if TYPE_CHECKING:
+    import requests
+
+
+_session: Optional['requests.Session'] = None
+_lock = threading.Lock()
+
+
+def get_timeout() -> Tuple[float, float]:
+    """Return (connect, read) timeout in seconds.
+    """
+    conf = get_config()
+    return (
+        conf.getfloat('http', 'connect_timeout', fallback=3),
+        conf.getfloat('http', 'read_timeout', fallback=3),
+    )
+
+
+def create_session(pool_size: int = None) -> 'requests.Session':
+    """Create a session with connection pool and default headers.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    conf = get_config()
+    if pool_size is None:
+        pool_size = conf.getint('http', 'pool_size', fallback=10)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'User-Agent': conf.get('headers', 'user_agent'),
+        'Accept-Encoding': 'gzip, deflate',
+    })
+    return session
+
+
+def get_session() -> 'requests.Session':
+    """Return the session shared by the whole process.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session()
+    return _session
+
+
+def reset_session(pool_size: int = None) -> 'requests.Session':
+    """Replace the shared session, e.g. by one with a larger pool.
+    """
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = create_session(pool_size)
+    return _session
+
+
+def get(url: str, **kwargs) -> 'requests.Response':
+    """GET request through the shared session.
+    """
+    kwargs.setdefault('timeout', get_timeout())
+    return get_session().get(url, **kwargs)
@@ -0,0 +1,26 @@
+"""Configuration from config.ini, read once on first use.
+
+Importing a module never reads the file, get_config() reads it
+when a setting is needed for the first time. config.ini in the current
+directory wins, otherwise the one in the repository is used, so the
+apps work when run from another directory too.
+"""
+
+from configparser import ConfigParser
+from functools import lru_cache
+from pathlib import Path
+from typing import Union
+
+
+CONFIG = 'config.ini'
+DEFAULT_CONFIG = Path(__file__).resolve().parent.parent / CONFIG
+
+
+@lru_cache(maxsize=None)
+def get_config(path: Union[str, Path] = None) -> ConfigParser:
+    if path is None:
+        path = CONFIG if Path(CONFIG).exists() else DEFAULT_CONFIG
+    conf = ConfigParser()
+    conf.read(path, encoding='utf-8')
+    return conf
+
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+"""Sidecar index of licence ids in a csv file.
+
+Next to data.csv the index data.csv.idx keeps sorted licence ids with
+byte offset and length of their rows. Rows of one licence written
+one after another (e.g. all its facilities) are one entry. The index
+is read through mmap, so the number of rows, ids in a range and rows
+of one licence are found without parsing the csv.
+
+The index remembers size and modification time of the csv. When they
+differ, the index is stale and CsvIndex.open returns None, callers
+then read the csv as before. Ids must be numbers (licence ids are),
+otherwise no index is written. Arrays are in native byte order,
+the index is rebuilt from the csv on another machine anyway.
+"""
+
+import csv
+import io
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+
+SUFFIX = '.idx'
+MAGIC = b'CSVIDX01'
+# Magic, csv size, csv mtime in ns, number of rows, licences and entries
+HEADER = struct.Struct('=8sQQQQQ')
+
+PathLike = Union[str, os.PathLike]
+
+
+def index_path(path: PathLike) -> str:
+    return os.fspath(path) + SUFFIX
+
+
+def csv_stat(path: PathLike) -> Optional[Tuple[int, int]]:
+    """Size and modification time of csv, None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _records(f: BinaryIO, start: int) -> Iterator[Tuple[List[str], int, int]]:
+    """Yield rows of csv from byte start with their offset and length.
+    """
+    f.seek(start)
+    pos = start
+
+    def lines():
+        nonlocal pos
+        for line in f:
+            pos += len(line)
+            yield line.decode('utf-8')
+
+    begin = start
+    # csv.reader takes only the lines of the current row, so pos
+    # is at the end of the row when the row is returned
+    for row in csv.reader(lines()):
+        yield row, begin, pos - begin
+        begin = pos
+
+
+def _header_length(f: BinaryIO) -> Tuple[List[str], int]:
+    for row, _, length in _records(f, 0):
+        return row, length
+    return [], 0
+
+
+def build(
+    path: PathLike, column: str, previous: Optional[Tuple[int, int]] = None,
+        ) -> bool:
+    """Write index of csv by licence ids in column, True if written.
+
+    previous is csv_stat of the csv before rows were appended to it.
+    If the existing index is of exactly that csv, only the appended
+    rows are read, otherwise the whole csv.
+    """
+    entries = []
+    rows = 0
+    with open(path, 'rb') as f:
+        header, start = _header_length(f)
+        if column not in header:
+            return False
+        position = header.index(column)
+
+        old = CsvIndex.open(path, expected=previous) if previous else None
+        if old is not None:
+            with old:
+                entries = list(zip(old.ids, old.offsets, old.lengths))
+                rows = old.rows
+            start = previous[0]
+
+        appended = []
+        for row, offset, length in _records(f, start):
+            if not row:
+                continue
+            if not row[position].isdigit():
+                # Not a licence id, rows can not be indexed
+                _remove(path)
+                return False
+            rows += 1
+            lic_id = int(row[position])
+            last = appended[-1] if appended else None
+            if last and last[0] == lic_id and last[1] + last[2] == offset:
+                last[2] += length
+            else:
+                appended.append([lic_id, offset, length])
+
+    entries.extend(tuple(entry) for entry in appended)
+    entries.sort()
+    licences = len({entry[0] for entry in entries})
+
+    size, mtime_ns = csv_stat(path)
+    tmp = index_path(path) + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, size, mtime_ns, rows, licences, len(entries)))
+        for values in zip(*entries) if entries else ((), (), ()):
+            array('Q', values).tofile(f)
+    os.replace(tmp, index_path(path))
+    return True
+
+
+def _remove(path: PathLike) -> None:
+    try:
+        os.remove(index_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def replace(src: PathLike, dst: PathLike) -> None:
+    """Move csv and its index, like os.replace.
+    """
+    os.replace(src, dst)
+    if os.path.exists(index_path(src)):
+        os.replace(index_path(src), index_path(dst))
+    else:
+        _remove(dst)
+
+
+class CsvIndex:
+
+    def __init__(
+        self, path: PathLike, mm: mmap.mmap, rows: int, licences: int,
+        count: int,
+            ):
+        self.path = path
+        self.rows = rows
+        self.licences = licences
+        self._mm = mm
+        view = memoryview(mm)
+        start = HEADER.size
+        step = count * 8
+        self.ids = view[start:start + step].cast('Q')
+        self.offsets = view[start + step:start + 2 * step].cast('Q')
+        self.lengths = view[start + 2 * step:start + 3 * step].cast('Q')
+        self._csv = None
+        self._header = None
+
+    @classmethod
+    def open(
+        cls, path: PathLike, expected: Optional[Tuple[int, int]] = None,
+            ) -> Optional['CsvIndex']:
+        """Open index of csv, None if it is missing or stale.
+
+        expected is csv_stat the index must be of, the current one
+        by default.
+        """
+        expected = expected or csv_stat(path)
+        try:
+            with open(index_path(path), 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if len(mm) >= HEADER.size:
+            magic, size, mtime_ns, rows, licences, count = HEADER.unpack_from(mm)
+            if (
+                magic == MAGIC and (size, mtime_ns) == expected
+                and len(mm) == HEADER.size + 3 * 8 * count
+                    ):
+                return cls(path, mm, rows, licences, count)
+        mm.close()
+        return None
+
+    def close(self) -> None:
+        for view in (self.ids, self.offsets, self.lengths):
+            view.release()
+        self._mm.close()
+        if self._csv is not None:
+            self._csv.close()
+            self._csv = None
+
+    def __enter__(self) -> 'CsvIndex':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Number of distinct licence ids.
+        """
+        return self.licences
+
+    def __contains__(self, lic_id: Union[str, int]) -> bool:
+        i = bisect_left(self.ids, int(lic_id))
+        return i < len(self.ids) and self.ids[i] == int(lic_id)
+
+    def between(self, first: Union[str, int], last: Union[str, int]) -> List[str]:
+        """Sorted ids from first to last (both included).
+        """
+        lo = bisect_left(self.ids, int(first))
+        hi = bisect_right(self.ids, int(last))
+        ids = []
+        for lic_id in self.ids[lo:hi]:
+            if not ids or ids[-1] != lic_id:
+                ids.append(lic_id)
+        return [str(lic_id) for lic_id in ids]
+
+    def _read(self, offset: int, length: int) -> List[Dict[str, str]]:
+        if self._csv is None:
+            with open(self.path, 'rb') as f:
+                self._header = _header_length(f)[0]
+                self._csv = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        text = self._csv[offset:offset + length].decode('utf-8')
+        return [
+            dict(zip(self._header, row))
+            for row in csv.reader(io.StringIO(text, newline='')) if row
+            ]
+
+    def lookup(self, lic_id: Union[str, int]) -> List[Dict[str, str]]:
+        """Rows of licence as dicts, empty list if there are none.
+        """
+        lo = bisect_left(self.ids, int(lic_id))
+        hi = bisect_right(self.ids, int(lic_id))
+        rows = []
+        for i in range(lo, hi):
+            rows.extend(self._read(self.offsets[i], self.lengths[i]))
+        return rows
+
+    def range(
+        self, first: Union[str, int], last: Union[str, int],
+            ) -> Iterator[Dict[str, str]]:
+        """Rows of licences from first to last id (both included) by id.
+        """
+        lo = bisect_left(self.ids, int(first))
+        hi = bisect_right(self.ids, int(last))
+        for i in range(lo, hi):
+            yield from self._read(self.offsets[i], self.lengths[i])
+
+
+def count_rows(path: PathLike) -> int:
+    """Number of rows of csv without header, from index if there is one.
+    """
+    index = CsvIndex.open(path)
+    if index is not None:
+        with index:
+            return index.rows
+    with open(path, newline='', encoding='utf-8') as csvf:
+        return sum(1 for row in csv.DictReader(csvf))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""SQLite storage shared by holders and licenses.
+
+Database runs in WAL mode, so it can be read while a run writes
+to it, and rows are written in batches with executemany upserts.
+Running the same export again updates the rows instead of adding
+duplicates.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Sequence, Union
+
+
+BATCH_SIZE = 500
+
+
+def connect(
+    path: Union[str, Path], schema: str = '', wal: bool = True, **kwargs,
+        ) -> sqlite3.Connection:
+    """Open database in WAL mode and create tables from schema.
+
+    Without wal the default rollback journal is used, which works also
+    for a database on a network filesystem shared by several machines.
+    Other keyword arguments are passed to sqlite3.connect.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, **kwargs)
+    if wal:
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+    if schema:
+        conn.executescript(schema)
+    return conn
+
+
+def upsert_sql(
+    table: str, columns: Sequence[str], key: Sequence[str]
+        ) -> str:
+    """Insert statement updating the row with the same key.
+    """
+    placeholders = ', '.join('?' for _ in columns)
+    updates = ', '.join(
+        f'{column} = excluded.{column}' for column in columns
+        if column not in key
+        )
+    return (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders}) '
+        f'ON CONFLICT ({", ".join(key)}) DO UPDATE SET {updates}'
+        )
+
+
+def upsert(
+    conn: sqlite3.Connection, table: str, columns: Sequence[str],
+    key: Sequence[str], rows: Iterable[tuple],
+        ) -> None:
+    conn.executemany(upsert_sql(table, columns, key), rows)
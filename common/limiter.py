@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+"""Adaptive limit of requests in flight and requests per second.
+
+AdaptiveLimiter works like TCP congestion control (AIMD). Every
+successful response adds to the allowed number of requests in flight
+(by one until the first congestion, then by 1/limit) and to the rate.
+Congestion halves the limit: a timeout or connection error, 429, 502,
+503 or 504 response, or latency much higher than the best one seen.
+429 also halves the rate (paced from then on) and Retry-After of
+a response stops all requests for the given time.
+
+The rate never exceeds max_rps from config.ini [http], the limit
+never exceeds the number of threads doing the requests.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from common import metrics
+from common.config import get_config
+
+
+# Responses telling the server is overloaded
+CONGESTION_STATUSES = frozenset((429, 502, 503, 504))
+# Responses requested again
+RETRY_STATUSES = CONGESTION_STATUSES | {500}
+
+INITIAL_LIMIT = 2
+DECREASE = 0.5
+# Latency this many times the best smoothed latency means congestion
+LATENCY_FACTOR = 3.0
+# Weight of a new response in smoothed latency
+SMOOTHING = 0.2
+MIN_RPS = 0.5
+# Smallest increase of the rate after a response
+RATE_STEP = 0.02
+# Seconds of responses the measured rate is taken from
+WINDOW = 5.0
+MIN_SAMPLES = 10
+
+BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from Retry-After header, delay in seconds or http date.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    # Rare, email is slow to import
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int) -> float:
+    """Exponential backoff with jitter before the next attempt.
+    """
+    return random.uniform(0, min(BACKOFF * 2 ** attempt, MAX_BACKOFF))
+
+
+class AdaptiveLimiter:
+
+    def __init__(
+        self, max_limit: int = 1, max_rps: Optional[float] = None,
+        retries: int = 3,
+            ):
+        self.max_limit = max(max_limit, 1)
+        self.max_rps = max_rps or None
+        self.retries = retries
+
+        self.limit = float(min(INITIAL_LIMIT, self.max_limit))
+        # None means requests are not paced
+        self.rate = self.max_rps
+        self.in_flight = 0
+
+        self._cond = threading.Condition()
+        self._next = 0.0
+        self._blocked_until = 0.0
+        self._slow_start = True
+        self._latency = None
+        self._best_latency = None
+        self._last_decrease = 0.0
+        self._completed = deque()
+
+    @classmethod
+    def from_config(cls, max_limit: int = 1) -> 'AdaptiveLimiter':
+        conf = get_config()
+        return cls(
+            max_limit,
+            conf.getfloat('http', 'max_rps', fallback=0),
+            conf.getint('http', 'retries', fallback=3),
+            )
+
+    def acquire(self) -> None:
+        """Wait until a request may be sent.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.in_flight < int(self.limit):
+                    wait = max(self._blocked_until, self._next) - now
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+            self.in_flight += 1
+            if self.rate:
+                self._next = max(self._next, now) + 1 / self.rate
+
+    def release(
+        self, status: int = None, latency: float = None,
+        retry_after: Optional[str] = None, error: bool = False,
+            ) -> None:
+        """Adjust limit and rate by the outcome of a request.
+
+        error is True for a timeout or connection error.
+        """
+        with self._cond:
+            now = time.monotonic()
+            self.in_flight -= 1
+
+            self._completed.append(now)
+            while self._completed and self._completed[0] < now - WINDOW:
+                self._completed.popleft()
+
+            if latency is not None:
+                if self._latency is None:
+                    self._latency = latency
+                else:
+                    self._latency += SMOOTHING * (latency - self._latency)
+                if self._best_latency is None or self._latency < self._best_latency:
+                    self._best_latency = self._latency
+
+            congested = (
+                error
+                or status in CONGESTION_STATUSES
+                or (
+                    self._latency is not None
+                    and self._latency > self._best_latency * LATENCY_FACTOR
+                    )
+                )
+
+            if congested:
+                self._decrease(now, throttled=status == 429)
+            else:
+                self._increase()
+
+            delay = parse_retry_after(retry_after)
+            if delay:
+                self._blocked_until = max(self._blocked_until, now + delay)
+                # The pause would lower the measured rate
+                self._completed.clear()
+
+            metrics.set_gauge('limiter_limit', self.limit)
+            metrics.set_gauge('limiter_rate', self.rate or 0)
+            self._cond.notify_all()
+
+    def _decrease(self, now: float, throttled: bool) -> None:
+        # Responses to requests sent before the last decrease
+        # do not decrease the limit again
+        if now - self._last_decrease < (self._latency or 0):
+            return
+        self._last_decrease = now
+        self._slow_start = False
+        self.limit = max(self.limit * DECREASE, 1.0)
+
+        # Rate of responses is not known right after a pause
+        if throttled and len(self._completed) >= MIN_SAMPLES:
+            # Responses may complete at the same instant
+            span = max(now - self._completed[0], 1e-6)
+            measured = len(self._completed) / span
+            rate = min(self.rate or measured, measured)
+            self.rate = max(rate * DECREASE, MIN_RPS)
+        metrics.inc('limiter_decreases_total')
+
+    def _increase(self) -> None:
+        if self._slow_start:
+            self.limit = min(self.limit + 1, self.max_limit)
+        else:
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+
+        if self.rate:
+            # At least one more request per second every second
+            self.rate += max(1 / self.rate, RATE_STEP)
+            if self.max_rps:
+                self.rate = min(self.rate, self.max_rps)
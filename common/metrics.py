@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+"""Counters, gauges and latency histograms of the download stages.
+
+Stages record into one process wide registry:
+
+    metrics.inc('fetch_bytes_total', len(content))
+    metrics.observe('fetch_seconds', elapsed, status='200')
+    with metrics.timer('write_seconds', output='csv'):
+        ...
+
+Exporter writes snapshots of the registry periodically to a file,
+as json or in Prometheus text format (files ending with .prom),
+so it is possible to tell whether a slow run waits for the network,
+the parser or the disk.
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+
+# Upper bounds of histogram buckets in seconds
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+    )
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: dict) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket with q-th quantile.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Key, float] = {}
+        self.gauges: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> dict:
+        """All values as a json serializable dict.
+        """
+        def name(key: Key) -> str:
+            metric, labels = key
+            if not labels:
+                return metric
+            return metric + '{' + ','.join(f'{k}={v}' for k, v in labels) + '}'
+
+        with self._lock:
+            return {
+                'timestamp': time.time(),
+                'uptime': time.time() - self.started,
+                'counters': {name(k): v for k, v in sorted(self.counters.items())},
+                'gauges': {name(k): v for k, v in sorted(self.gauges.items())},
+                'histograms': {
+                    name(k): {
+                        'count': h.count,
+                        'sum': h.sum,
+                        'p50': h.quantile(0.5),
+                        'p90': h.quantile(0.9),
+                        'p99': h.quantile(0.99),
+                    }
+                    for k, h in sorted(self.histograms.items())
+                },
+            }
+
+    def prometheus(self) -> str:
+        """All values in Prometheus text exposition format.
+        """
+        def labels(pairs, extra=()) -> str:
+            pairs = list(pairs) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        lines: List[str] = []
+        with self._lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                typed = set()
+                for (metric, pairs), value in sorted(values.items()):
+                    if metric not in typed:
+                        lines.append(f'# TYPE {metric} {kind}')
+                        typed.add(metric)
+                    lines.append(f'{metric}{labels(pairs)} {value}')
+
+            typed = set()
+            for (metric, pairs), h in sorted(self.histograms.items()):
+                if metric not in typed:
+                    lines.append(f'# TYPE {metric} histogram')
+                    typed.add(metric)
+                total = 0
+                for bound, count in zip(h.buckets + ('+Inf',), h.counts):
+                    total += count
+                    lines.append(
+                        f'{metric}_bucket{labels(pairs, [("le", bound)])} {total}'
+                        )
+                lines.append(f'{metric}_sum{labels(pairs)} {h.sum}')
+                lines.append(f'{metric}_count{labels(pairs)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    registry.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    registry.set(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    registry.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """Observe duration of the block in seconds.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+
+class Exporter:
+    """Write snapshots of registry to path every interval seconds.
+
+    Path ending with .prom gets Prometheus text format (e.g. for
+    node_exporter textfile collector), other paths json.
+    """
+
+    def __init__(
+        self, path: Path, interval: float = 10.0, registry: Registry = registry,
+            ):
+        self.path = Path(path)
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write(self) -> None:
+        if self.path.suffix == '.prom':
+            text = self.registry.prometheus()
+        else:
+            text = json.dumps(self.registry.snapshot(), indent=1)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(text)
+        os.replace(tmp, self.path)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self) -> 'Exporter':
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the thread and write the final snapshot.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.write()
+
+    def __enter__(self) -> 'Exporter':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
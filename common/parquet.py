@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""Partitioned Parquet export shared by holders and licenses.
+
+Tables are written as hive partitioned datasets
+(e.g. business=electricity/kraj=Plzeňský/part-....parquet) with typed
+columns, so that analytics read only the columns and partitions
+they need. Requires pyarrow.
+"""
+
+import uuid
+from pathlib import Path
+from typing import Dict, List, Sequence, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Dictionary encoded string column for values repeating many times
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+
+def write_dataset(
+    columns: Dict[str, List], schema: pa.Schema,
+    root: Union[str, Path], partition_cols: Sequence[str],
+        ) -> None:
+    """Append rows given as lists of column values to dataset in root.
+    """
+    table = pa.Table.from_pydict(columns, schema=schema)
+    if table.num_rows == 0:
+        return
+    pq.write_to_dataset(
+        table, str(root),
+        partition_cols=list(partition_cols),
+        basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+        )
+
+
+def read_dataset(root: Union[str, Path], **kwargs) -> pa.Table:
+    return pq.read_table(str(root), **kwargs)
@@ -1,7 +1,3 @@
-from configparser import ConfigParser
-
-
-conf = ConfigParser()
-
-conf.read('config.ini')
+from common.config import get_config
 
+__all__ = ['get_config']
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Export of licence holders to SQLite.
+
+Holders are keyed by licence id and version, a new version of
+a licence is added as a new row and the same version is updated.
+"""
+
+import dataclasses
+import sqlite3
+from datetime import date
+from itertools import islice
+from typing import Iterable
+
+from common import db
+from holders.main import Holder
+
+
+COLUMNS = tuple(field.name for field in dataclasses.fields(Holder))
+
+# Version is missing for some cancelled licences
+KEY = ('id', 'IFNULL(version, -1)')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS holders (
+    id TEXT NOT NULL,
+    version INTEGER,
+    status TEXT,
+    ic TEXT,
+    nazev TEXT,
+    cislo_dom TEXT,
+    cislo_or TEXT,
+    ulice TEXT,
+    obec TEXT,
+    obec_cast TEXT,
+    psc TEXT,
+    okres TEXT,
+    kraj TEXT,
+    zeme TEXT,
+    den_opravneni DATE,
+    den_zahajeni DATE,
+    den_zaniku DATE,
+    den_nabyti DATE,
+    osoba TEXT,
+    predmet TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS holders_id_version
+    ON holders (id, IFNULL(version, -1));
+CREATE INDEX IF NOT EXISTS holders_ic ON holders (ic);
+'''
+
+
+def _adapt(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def connect(path) -> sqlite3.Connection:
+    return db.connect(path, SCHEMA)
+
+
+def write_holders(
+    conn: sqlite3.Connection, holders: Iterable[Holder],
+    batch_size: int = db.BATCH_SIZE,
+        ) -> int:
+    """Upsert holders in batches and return their count.
+    """
+    rows = (
+        tuple(_adapt(getattr(holder, column)) for column in COLUMNS)
+        for holder in holders
+        )
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        with conn:
+            db.upsert(conn, 'holders', COLUMNS, KEY, batch)
+        count += len(batch)
+    return count
@@ -6,19 +6,25 @@ e.g. for electricity or heat production.
 """
 
 import argparse
+import codecs
 import dataclasses
 import pathlib
 import xml.etree.ElementTree as ET
-from typing import Optional, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, Iterator, Optional, List, Tuple, Union
+from urllib.parse import urljoin
 from dataclasses import dataclass, fields
 from datetime import date
 import csv
 import configparser
 
-import requests
-from bs4 import BeautifulSoup
+from common import client, csvindex
+from holders.config import get_config
 
-from holders.config import conf
+# requests and bs4 are imported on first use, they slow down startup
+if TYPE_CHECKING:
+    import requests
 
 
 @dataclass
@@ -86,69 +92,285 @@ translation = {
 }
 
 
+# Map to strings used on the website to find a correct xml file
+business_map = {
+    'electricity': 'výroba elektřiny',
+    'electricity-dist': 'distribuce elektřiny',
+    'electricity-trade': 'obchod s elektřinou',
+    'heat': 'výroba tepelné energie',
+    'heat-dist': 'rozvod tepelné energie',
+    'gas': 'výroba plynu',
+    'gas-dist': 'distribuce plynu',
+    'gas-trade': 'obchod s plynem',
+}
+
+
+CHUNK_SIZE = 1 << 16
+
+
 def request_data(url, **kwargs):
+    import requests
+
     try:
-        r = requests.get(url, **kwargs)
+        r = client.get(url, **kwargs)
         return r
     except requests.RequestException as e:
         raise SystemExit(e)
 
 
-def get_xml(url: str, business: str, **kwargs) -> requests.models.Response:
-    """Find and return xml from the website for particular business type.
+def find_xml_urls(url: str, businesses: Iterable[str], **kwargs) -> Dict[str, str]:
+    """Find links to xml of all businesses on one request of the index page.
 
     Args:
         url (str) : Endpoint for licence holders (držitelé licencí) datasets
-        business (str) : e.g. 'výroba elektřiny' or 'výroba tepelné energie'
-    
+        businesses : e.g. ['výroba elektřiny', 'výroba tepelné energie']
+
     Returns:
-        requests.models.Reponse
+        dict of business and absolute url of its xml
     """
+    from bs4 import BeautifulSoup
+
     r = request_data(url, **kwargs)
     bs = BeautifulSoup(r.content, 'html.parser')
-    xml_url = bs.find("a", text=business).attrs['href']
-    xml_url = "https://www.eru.cz" + xml_url
-    print(f'XML file is at: {xml_url}')
 
-    r = request_data(xml_url, **kwargs)
-    r.encoding = 'cp1250'
+    urls = {}
+    for business in businesses:
+        link = bs.find("a", string=business)
+        if link is None:
+            raise SystemExit(f'Link to xml for {business} not found at {url}')
+        # Links on the page are relative to the site
+        urls[business] = urljoin(r.url, link.attrs['href'])
+        print(f'XML file is at: {urls[business]}')
+    return urls
+
 
+def download_xml(xml_url: str, **kwargs) -> 'requests.models.Response':
+    """Request xml, response is streamed, read its body with open_xml.
+    """
+    r = request_data(xml_url, stream=True, **kwargs)
+    r.raw.decode_content = True
+    r.encoding = 'cp1250'
     return r
 
 
-def parse_xml(
-    xml: Union[requests.models.Response, pathlib.Path],
-    business: str
-    ) -> List[Holder]:
-    """Parse xml to a list of Holders.
+def get_xml(url: str, business: str, **kwargs) -> 'requests.models.Response':
+    """Find and return xml from the website for particular business type.
+
+    Response is streamed, read its body with open_xml.
+
+    Args:
+        url (str) : Endpoint for licence holders (držitelé licencí) datasets
+        business (str) : e.g. 'výroba elektřiny' or 'výroba tepelné energie'
+    
+    Returns:
+        requests.models.Reponse
+    """
+    xml_url = find_xml_urls(url, [business], **kwargs)[business]
+    return download_xml(xml_url, **kwargs)
+
+
+@contextmanager
+def open_xml(
+    xml: Union['requests.models.Response', pathlib.Path]
+        ) -> Iterator[Tuple[BinaryIO, Optional[str]]]:
+    """Open xml file or response body as a byte stream.
+
+    Yields the stream and encoding which overrides the one declared in xml.
+    Error of the connection while the response is read ends the app
+    as in request_data.
     """
     if isinstance(xml, pathlib.Path):
         try:
-            tree = ET.parse(xml)
-            root = tree.getroot()
+            f = open(xml, 'rb')
         except FileNotFoundError:
             print('download xml files to samples directory with --dev option. see config.ini [samples]')
             raise SystemExit
+        with f:
+            yield f, None
     else:
-        root = ET.fromstring(xml.text)
-    
-    holders = []
+        import requests
+        from urllib3.exceptions import HTTPError
+
+        with xml:
+            try:
+                yield xml.raw, xml.encoding
+            except (requests.RequestException, HTTPError) as e:
+                # Connection lost while the body was being read
+                raise SystemExit(e)
+
+
+def iter_xml(
+    stream: BinaryIO, business: str, encoding: str = None
+        ) -> Iterator[Holder]:
+    """Parse xml incrementally and yield Holders one by one.
+
+    Every parsed element is cleared right away,
+    so memory does not grow with the size of the xml.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    decoder = codecs.getincrementaldecoder(encoding)() if encoding else None
+
+    depth = 0
+    root = None
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        data = decoder.decode(chunk, final=not chunk) if decoder else chunk
+        if data:
+            parser.feed(data)
+        if not chunk:
+            parser.close()
+
+        for event, element in parser.read_events():
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    root = element
+                continue
+
+            depth -= 1
+            if depth == 1:
+                original = element.attrib
+
+                holder = Holder(
+                    **{new_key: func(original[orig_key]) for orig_key, (new_key, func) in translation.items()}
+                )
+
+                holder.predmet = business
 
-    for child in root:
-        original = child.attrib
+                yield holder
+                root.clear()
 
-        holder = Holder(
-            **{new_key: func(original[orig_key]) for orig_key, (new_key, func) in translation.items()}
-        )
+        if not chunk:
+            break
 
-        holder.predmet = business
 
-        holders.append(holder)
+def parse_xml(
+    xml: Union['requests.models.Response', pathlib.Path],
+    business: str
+    ) -> List[Holder]:
+    """Parse xml to a list of Holders.
+    """
+    with open_xml(xml) as (stream, encoding):
+        holders = list(iter_xml(stream, business, encoding))
 
     print(f"Parsed {len(holders)} licence holders")
     return holders
 
 
+def tee_csv(holders: Iterable[Holder], path: pathlib.Path) -> Iterator[Holder]:
+    """Write holders to csv as they come and yield them on.
+
+    The index of licence ids (common.csvindex) is written after the csv.
+    """
+    with open(path, 'w') as csvf:
+        fieldnames = [field.name for field in dataclasses.fields(Holder)]
+        writer = csv.DictWriter(csvf, fieldnames=fieldnames)
+        writer.writeheader()
+        for holder in holders:
+            writer.writerow(dataclasses.asdict(holder))
+            yield holder
+
+    # Sidecar index for counts and lookups without parsing the csv
+    csvindex.build(path, 'id')
+
+
+def write_csv(holders: Iterable[Holder], path: pathlib.Path) -> int:
+    """Write holders to csv as they come and return their count.
+
+    The csv is replaced only when all holders are written, an interrupted
+    download keeps the previous one.
+    """
+    tmp = path.with_name(path.name + '.tmp')
+    try:
+        count = sum(1 for holder in tee_csv(holders, tmp))
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    csvindex.replace(tmp, path)
+    return count
+
+
+def sample_xml(business: str) -> pathlib.Path:
+    try:
+        return pathlib.Path('samples') / get_config().get('samples', business)
+    except configparser.NoOptionError as e:
+        print(f'{e}. download sample xml for electricity or heat. see config.ini [samples]')
+        raise SystemExit
+
+
+def export(
+    business: str, xml: Union['requests.models.Response', pathlib.Path],
+    args: dict,
+        ) -> int:
+    """Parse xml of one business and write holders to selected output.
+
+    Returns number of holders.
+    """
+    # Parse xml data and save them as csv file in csvs directory
+    # while the xml is being read
+    with open_xml(xml) as (stream, encoding):
+        holders = iter_xml(stream, business_map[business], encoding)
+
+        if args['parquet']:
+            from holders import parquet
+            return parquet.write_holders(
+                holders, pathlib.Path(args['parquet']) / 'holders', business,
+                )
+        elif args['sqlite']:
+            from holders import db
+            conn = db.connect(args['sqlite'])
+            with closing(conn):
+                return db.write_holders(conn, holders)
+        elif args['csv']:
+            csv_filename = args['output']
+
+            output_dir = pathlib.Path(f'csvs/holders/{business}')
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+            return write_csv(holders, output_dir / csv_filename)
+        else:
+            return sum(1 for holder in holders)
+
+
+def export_all(args: dict, url: str = None) -> Dict[str, int]:
+    """Export holders of all businesses at once.
+
+    Links to all xml files are found on one request of the index page,
+    then every xml is downloaded and parsed in its own thread. The threads
+    share the connection pool of common.client, so the whole export takes
+    about as long as the largest xml.
+    """
+    if args['dev']:
+        # Only businesses with sample xml, see config.ini [samples]
+        conf = get_config()
+        sources = {
+            business: pathlib.Path('samples') / conf.get('samples', business)
+            for business in business_map
+            if conf.has_option('samples', business)
+            }
+    else:
+        xml_urls = find_xml_urls(url, business_map.values())
+        sources = {business: xml_urls[business_map[business]] for business in business_map}
+
+    def run(business: str) -> int:
+        xml = sources[business]
+        try:
+            if isinstance(xml, str):
+                xml = download_xml(xml)
+            return export(business, xml, args)
+        except SystemExit as e:
+            raise SystemExit(f'{business}: {e}')
+
+    counts = {}
+    with ThreadPoolExecutor(max_workers=len(sources) or 1) as executor:
+        futures = {business: executor.submit(run, business) for business in sources}
+        for business, future in futures.items():
+            counts[business] = future.result()
+            print(f"Parsed {counts[business]} licence holders for {business}")
+    return counts
+
+
 def get_parser():
     parser = argparse.ArgumentParser(
         prog='holders',
@@ -170,15 +392,28 @@ def get_parser():
         help='export parsed data to csv (default: True)'
     )
 
+    parser.add_argument(
+        '--sqlite',
+        metavar='FILENAME',
+        action='store',
+        default=None,
+        help='export parsed data to SQLite database instead of csv (default: None)'
+    )
+
+    parser.add_argument(
+        '--parquet',
+        metavar='DIRECTORY',
+        action='store',
+        default=None,
+        help='export parsed data to partitioned Parquet instead of csv (default: None)'
+    )
+
     parser.add_argument(
         '--business',
         action='store',
-        choices=[
-            'electricity', 'electricity-dist', 'electricity-trade',
-            'heat', 'heat-dist', 'gas', 'gas-dist', 'gas-trade',
-            ],
+        choices=list(business_map) + ['all'],
         default='electricity',
-        help='select business type: e.g. electricity or heat (default: electricity)'
+        help='select business type: e.g. electricity or heat, all for every type at once (default: electricity)'
     )    
 
     parser.add_argument(
@@ -199,52 +434,22 @@ def main() -> None:
 
     business = args['business']
 
-    # Map to strings used on the website to find a correct xml file
-    business_map = {
-        'electricity': 'výroba elektřiny',
-        'electricity-dist': 'distribuce elektřiny',
-        'electricity-trade': 'obchod s elektřinou',
-        'heat': 'výroba tepelné energie',
-        'heat-dist': 'rozvod tepelné energie',
-        'gas': 'výroba plynu',
-        'gas-dist': 'distribuce plynu',
-        'gas-trade': 'obchod s plynem',
-    }
-    
+    if business == 'all':
+        export_all(args, get_config().get('holders', 'url'))
+        return
+
     # Request data from the website or
     # prevent request to the website when developing the app
     # and use sample xml files manually downloaded from the website
     # to directory samples. See config.ini [samples]
     if args['dev']:
-        try:
-            xml = pathlib.Path('samples') / conf.get('samples', business)
-        except configparser.NoOptionError as e:
-            print(f'{e}. download sample xml for electricity or heat. see config.ini [samples]')
-            raise SystemExit
+        xml = sample_xml(business)
     else:
-        url = conf.get('holders', 'url')
-        headers = {'User-Agent': conf.get('headers', 'user_agent')}
-        xml = get_xml(url=url, business=business_map[business],
-                headers=headers, timeout=3)
-    
-    # Parse xml data
-    holders = parse_xml(xml, business_map[business])
-    
-    # Save parsed data as csv file in csvs directory
-    if args['csv']:
-        csv_filename = args['output']
-
-        output_dir = pathlib.Path(f'csvs/holders/{business}')
-        output_dir.mkdir(parents=True, exist_ok=True)
-
-        with open(output_dir / csv_filename, 'w') as csvf:
-            fieldnames = [field.name for field in dataclasses.fields(Holder)]
-            writer = csv.DictWriter(csvf, fieldnames=fieldnames)
-            writer.writeheader()
-            for holder in holders:
-                writer.writerow(dataclasses.asdict(holder))
-    
-    # TODO: Save data to database
+        url = get_config().get('holders', 'url')
+        xml = get_xml(url=url, business=business_map[business])
+
+    count = export(business, xml, args)
+    print(f"Parsed {count} licence holders")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""Export of licence holders to Parquet partitioned by business and kraj.
+"""
+
+import dataclasses
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Union
+
+import pyarrow as pa
+
+from common.parquet import DICTIONARY, write_dataset
+from holders.main import Holder
+
+
+BATCH_SIZE = 50000
+
+SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('version', pa.int32()),
+    ('status', DICTIONARY),
+    ('ic', pa.string()),
+    ('nazev', pa.string()),
+    ('cislo_dom', pa.string()),
+    ('cislo_or', pa.string()),
+    ('ulice', pa.string()),
+    ('obec', DICTIONARY),
+    ('obec_cast', DICTIONARY),
+    ('psc', pa.string()),
+    ('okres', DICTIONARY),
+    ('kraj', DICTIONARY),
+    ('zeme', DICTIONARY),
+    ('den_opravneni', pa.date32()),
+    ('den_zahajeni', pa.date32()),
+    ('den_zaniku', pa.date32()),
+    ('den_nabyti', pa.date32()),
+    ('osoba', pa.string()),
+    ('predmet', DICTIONARY),
+    ('business', pa.string()),
+])
+
+
+def write_holders(
+    holders: Iterable[Holder], root: Union[str, Path], business: str,
+    batch_size: int = BATCH_SIZE,
+        ) -> int:
+    """Write holders to dataset in root and return their count.
+    """
+    names = [field.name for field in dataclasses.fields(Holder)]
+    holders = iter(holders)
+    count = 0
+    while True:
+        batch = list(islice(holders, batch_size))
+        if not batch:
+            break
+        columns = {
+            name: [getattr(holder, name) for holder in batch] for name in names
+            }
+        columns['business'] = [business] * len(batch)
+        write_dataset(columns, SCHEMA, root, ('business', 'kraj'))
+        count += len(batch)
+    return count
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+"""Columnar in-memory table of licence holders.
+
+Instead of one Holder object per licence, every attribute is kept
+in one numpy array. String columns are dictionary encoded (codes into
+a list of distinct values, -1 for None), dates are datetime64[D]
+(NaT for None) and version is int32 (-1 for None). Values repeating
+thousands of times such as kraj, okres or status are stored only once
+and filters are evaluated over whole columns at once.
+
+Requires numpy.
+"""
+
+import csv
+import dataclasses
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+from holders.main import Holder
+
+
+COLUMNS = tuple(field.name for field in dataclasses.fields(Holder))
+DATE_COLUMNS = tuple(
+    field.name for field in dataclasses.fields(Holder) if field.type is date
+    )
+INT_COLUMNS = ('version',)
+STR_COLUMNS = tuple(
+    name for name in COLUMNS if name not in DATE_COLUMNS + INT_COLUMNS
+    )
+
+
+class HolderRow:
+    """View of one row of HolderTable with attributes of Holder.
+    """
+
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table: 'HolderTable', index: int):
+        self._table = table
+        self._index = index
+
+    def __getattr__(self, name: str):
+        if name not in COLUMNS:
+            raise AttributeError(name)
+        return self._table.value(name, self._index)
+
+    def to_holder(self) -> Holder:
+        return Holder(**{name: getattr(self, name) for name in COLUMNS})
+
+    def __repr__(self) -> str:
+        return f'HolderRow({self._index}, id={self.id!r})'
+
+
+class HolderTable:
+
+    def __init__(
+        self, columns: Dict[str, np.ndarray], categories: Dict[str, List[str]]
+            ):
+        self.columns = columns
+        self.categories = categories
+        self._codes = {
+            name: {value: code for code, value in enumerate(values)}
+            for name, values in categories.items()
+            }
+
+    @classmethod
+    def from_holders(cls, holders: Iterable[Holder]) -> 'HolderTable':
+        """Build table from Holders, e.g. streamed by holders.main.iter_xml.
+        """
+        builder = _Builder()
+        for holder in holders:
+            builder.add(holder.__dict__)
+        return builder.build()
+
+    @classmethod
+    def from_csv(cls, *paths: Union[str, Path]) -> 'HolderTable':
+        """Build table from one or more holders csvs.
+
+        Dates are converted by numpy for the whole column at once.
+        """
+        builder = _Builder()
+        for path in paths:
+            with open(path) as csvf:
+                for row in csv.DictReader(csvf):
+                    builder.add(row)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+
+    def __getitem__(self, index: int) -> HolderRow:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return HolderRow(self, index % len(self))
+
+    def __iter__(self) -> Iterator[HolderRow]:
+        return (HolderRow(self, index) for index in range(len(self)))
+
+    def value(self, name: str, index: int):
+        """Decoded value of column name in row index.
+        """
+        value = self.columns[name][index]
+        if name in STR_COLUMNS:
+            return self.categories[name][value] if value >= 0 else None
+        if name in DATE_COLUMNS:
+            return None if np.isnat(value) else value.astype(date)
+        return int(value) if value >= 0 else None
+
+    def code(self, name: str, value: Optional[str]) -> int:
+        """Code of value in dictionary encoded column, -2 if not present.
+        """
+        if value is None:
+            return -1
+        return self._codes[name].get(value, -2)
+
+    def mask(self, name: str, value) -> np.ndarray:
+        """Boolean array of rows where column name equals value.
+        """
+        if name in STR_COLUMNS:
+            return self.columns[name] == self.code(name, value)
+        if name in DATE_COLUMNS:
+            if value is None:
+                return np.isnat(self.columns[name])
+            return self.columns[name] == np.datetime64(value, 'D')
+        return self.columns[name] == (-1 if value is None else value)
+
+    def isin(self, name: str, values: Iterable[str]) -> np.ndarray:
+        """Boolean array of rows where string column name is one of values.
+        """
+        codes = [self.code(name, value) for value in values]
+        return np.isin(self.columns[name], codes)
+
+    def filter(self, mask: np.ndarray) -> 'HolderTable':
+        """New table with rows selected by boolean mask or indices.
+        """
+        columns = {name: column[mask] for name, column in self.columns.items()}
+        return HolderTable(columns, self.categories)
+
+    def to_holders(self) -> Iterator[Holder]:
+        return (row.to_holder() for row in self)
+
+
+class _Builder:
+    """Collects rows of HolderTable, interning strings on the way.
+    """
+
+    def __init__(self):
+        self.codes = {name: {} for name in STR_COLUMNS}
+        self.values = {name: [] for name in COLUMNS}
+
+    def add(self, row: dict) -> None:
+        for name in STR_COLUMNS:
+            value = row[name]
+            if value is None:
+                self.values[name].append(-1)
+                continue
+            codes = self.codes[name]
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+            self.values[name].append(code)
+
+        for name in DATE_COLUMNS:
+            value = row[name]
+            self.values[name].append(str(value) if value else 'NaT')
+
+        for name in INT_COLUMNS:
+            value = row[name]
+            self.values[name].append(int(value) if value not in (None, '') else -1)
+
+    def build(self) -> HolderTable:
+        columns = {}
+        for name in STR_COLUMNS:
+            columns[name] = np.array(self.values[name], dtype=np.int32)
+        for name in DATE_COLUMNS:
+            columns[name] = np.array(self.values[name], dtype='datetime64[D]')
+        for name in INT_COLUMNS:
+            columns[name] = np.array(self.values[name], dtype=np.int32)
+
+        categories = {name: list(codes) for name, codes in self.codes.items()}
+        return HolderTable(columns, categories)
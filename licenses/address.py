@@ -1,27 +1,41 @@
 #!/usr/bin/env python
 
 """Upraví adresu a rozdělí ji na jednotlivé části (psč, obec apod.)
+
+Stejné adresy se opakují u tisíců provozoven, proto se výsledky
+ukládají do omezené LRU cache. Chybějící okres a kraj se doplní
+podle PSČ z tabulky sestavené z csv s držiteli licencí. Soubory
+tabulky se zadají přes use_psc_index (aplikace je bere z --psc-index
+nebo config.ini [address]), bez nich se okres a kraj nedoplňují.
 """
 
-import unicodedata
+import csv
 import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+CACHE_SIZE = 8192
 
+_cislo = re.compile('[0-9]+/*[0-9]*')
 
-def uprav_adresu(adresa):
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalizuj(adresa: str) -> Tuple[str, ...]:
     normalizovana = unicodedata.normalize('NFKC', adresa)
-    upravena = []
-    for cast in normalizovana.split(','):
-        upravena.append(cast.strip())
-    return upravena
+    return tuple(cast.strip() for cast in normalizovana.split(','))
+
+
+def uprav_adresu(adresa: str) -> List[str]:
+    return list(_normalizuj(adresa))
 
 
-def rozdel_adresu(adresa):
+def rozdel_adresu(adresa: Sequence[str]) -> tuple:
     psc = adresa[0][:6].rstrip().replace(' ', '')
     obec = adresa[0][6:].strip()
 
     ulice_cp = adresa[1]
-    re.search(re.compile('[0-9]+'), ulice_cp)
-    match = re.search('[0-9]+/*[0-9]*', ulice_cp)
+    match = _cislo.search(ulice_cp)
     if match:
         ulice = ulice_cp[:match.start()-1]
         cp = match.group()
@@ -35,4 +49,93 @@ def rozdel_adresu(adresa):
     except IndexError:
         kraj = None
 
+    # Doplní okres a kraj podle PSČ
+    if not okres or not kraj:
+        podle_psc = psc_index().get(psc)
+        if podle_psc:
+            okres = okres or podle_psc[1]
+            kraj = kraj or podle_psc[2]
+
     return psc, obec, ulice, cp, okres, kraj
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def zpracuj_adresu(adresa: str) -> tuple:
+    """Upraví a rozdělí adresu z textu stránky, výsledek je v cache.
+
+    Vyvolá IndexError, pokud adresa nemá obec nebo ulici.
+    """
+    return rozdel_adresu(_normalizuj(adresa))
+
+
+def zpracuj_adresy(
+    adresy: Iterable[Optional[str]]
+        ) -> List[Optional[tuple]]:
+    """Zpracuje celý sloupec adres, neúplná adresa vrátí None.
+    """
+    vysledky = []
+    for adresa in adresy:
+        try:
+            vysledky.append(zpracuj_adresu(adresa) if adresa else None)
+        except IndexError:
+            vysledky.append(None)
+    return vysledky
+
+
+def _bez_prefixu(nazev: str, slovo: str) -> str:
+    nazev = nazev.strip()
+    if nazev.startswith(slovo + ' '):
+        nazev = nazev[len(slovo) + 1:]
+    if nazev.endswith(' ' + slovo):
+        nazev = nazev[:-len(slovo) - 1]
+    return nazev
+
+
+def load_psc_index(paths: Iterable[str]) -> Dict[str, Tuple[str, str, str]]:
+    """Sestaví tabulku PSČ -> (obec, okres, kraj) z csv s držiteli licencí.
+    """
+    index = {}
+    for path in paths:
+        with open(path) as csvf:
+            for row in csv.DictReader(csvf):
+                psc = (row.get('psc') or '').replace(' ', '')
+                okres = row.get('okres')
+                kraj = row.get('kraj')
+                if not psc or psc in index or not okres or not kraj:
+                    continue
+                index[psc] = (
+                    row.get('obec') or '',
+                    _bez_prefixu(okres, 'okres'),
+                    _bez_prefixu(kraj, 'kraj'),
+                    )
+    return index
+
+
+_psc_paths: Optional[List[str]] = None
+_psc_index: Optional[Dict[str, Tuple[str, str, str]]] = None
+
+
+def use_psc_index(paths: Optional[Iterable[str]]) -> None:
+    """Nastaví csv s držiteli, ze kterých se sestaví tabulka PSČ.
+
+    None znamená bez tabulky. Tabulka se načte až při prvním použití.
+    """
+    global _psc_paths, _psc_index
+    _psc_paths = None if paths is None else [str(path) for path in paths]
+    _psc_index = None
+    zpracuj_adresu.cache_clear()
+
+
+def psc_paths() -> Optional[List[str]]:
+    """Csv nastavené přes use_psc_index, např. pro procesy parseru.
+    """
+    return _psc_paths
+
+
+def psc_index() -> Dict[str, Tuple[str, str, str]]:
+    """Tabulka PSČ načtená při prvním použití.
+    """
+    global _psc_index
+    if _psc_index is None:
+        _psc_index = load_psc_index(_psc_paths or [])
+    return _psc_index
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""On-disk cache of licence pages.
+
+Every page is stored under its lic-id in a directory named after
+the hash of the url, together with ETag and Last-Modified headers.
+Next run sends a conditional request and reuses the stored page
+when the server answers 304 Not Modified.
+
+In offline mode no requests are sent at all and only cached pages
+are used.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass
+class CachedPage:
+
+    content: bytes
+    etag: str = None
+    last_modified: str = None
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PageCache:
+
+    def __init__(self, directory: Path, offline: bool = False):
+        self.directory = Path(directory)
+        self.offline = offline
+
+    def _paths(self, lic_id: str, url: str):
+        url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+        base = self.directory / url_hash
+        return base / f'{lic_id}.html', base / f'{lic_id}.json'
+
+    def load(self, lic_id: str, url: str) -> Optional[CachedPage]:
+        page_path, meta_path = self._paths(lic_id, url)
+        try:
+            content = page_path.read_bytes()
+            meta = json.loads(meta_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return CachedPage(content, meta.get('etag'), meta.get('last_modified'))
+
+    def store(
+        self, lic_id: str, url: str, content: bytes,
+        etag: str = None, last_modified: str = None,
+            ) -> None:
+        page_path, meta_path = self._paths(lic_id, url)
+        page_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to temporary files first so that an interrupted run
+        # never leaves a truncated page in the cache
+        meta = {'url': url, 'etag': etag, 'last_modified': last_modified}
+        for path, data in (
+            (page_path, content),
+            (meta_path, json.dumps(meta).encode('utf-8')),
+                ):
+            tmp_path = path.with_suffix(path.suffix + '.tmp')
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
@@ -1,6 +1,3 @@
-from configparser import ConfigParser
+from common.config import get_config
 
-
-conf = ConfigParser()
-
-conf.read('config.ini')
+__all__ = ['get_config']
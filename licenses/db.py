@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""Export of parsed licences to SQLite.
+
+SqliteWriter can be used in place of CsvWriter. Licences are written
+in batches, each licence replaces all rows stored for it before,
+so a licence requested again never leaves duplicate or stale
+capacities and facilities behind.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import List, Union
+
+from common import db
+from licenses.parse import Licence, Provozovna, VykonLicence, VykonProvozovna
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS licenses (
+    id TEXT PRIMARY KEY,
+    predmet TEXT,
+    pocet_zdroju INTEGER
+);
+CREATE TABLE IF NOT EXISTS capacities (
+    lic_id TEXT NOT NULL,
+    druh TEXT NOT NULL,
+    technologie TEXT NOT NULL,
+    mw REAL,
+    PRIMARY KEY (lic_id, technologie, druh)
+);
+CREATE TABLE IF NOT EXISTS facilities (
+    id INTEGER NOT NULL,
+    lic_id TEXT NOT NULL,
+    nazev TEXT,
+    ulice TEXT,
+    cp TEXT,
+    psc TEXT,
+    obec TEXT,
+    okres TEXT,
+    kraj TEXT,
+    pocet_zdroju INTEGER,
+    katastralni_uzemi TEXT,
+    kod_katastru TEXT,
+    vymezeni TEXT,
+    PRIMARY KEY (lic_id, id)
+);
+CREATE TABLE IF NOT EXISTS facilities_capacities (
+    provozovna_id INTEGER NOT NULL,
+    lic_id TEXT NOT NULL,
+    druh TEXT NOT NULL,
+    technologie TEXT NOT NULL,
+    mw REAL,
+    PRIMARY KEY (lic_id, provozovna_id, technologie, druh)
+);
+CREATE INDEX IF NOT EXISTS facilities_id ON facilities (id);
+CREATE INDEX IF NOT EXISTS capacities_technologie
+    ON capacities (technologie);
+CREATE INDEX IF NOT EXISTS facilities_capacities_technologie
+    ON facilities_capacities (technologie);
+'''
+
+KEYS = {
+    Licence: ('id',),
+    VykonLicence: ('lic_id', 'technologie', 'druh'),
+    Provozovna: ('lic_id', 'id'),
+    VykonProvozovna: ('lic_id', 'provozovna_id', 'technologie', 'druh'),
+}
+
+TABLES = {
+    Licence: 'licenses',
+    VykonLicence: 'capacities',
+    Provozovna: 'facilities',
+    VykonProvozovna: 'facilities_capacities',
+}
+
+
+class SqliteWriter:
+
+    def __init__(
+        self, path: Union[str, Path], batch_size: int = db.BATCH_SIZE
+            ):
+        self.path = path
+        self.batch_size = batch_size
+        self.conn: sqlite3.Connection = None
+        self._batch: List[Licence] = []
+        self._sql = {
+            cls: db.upsert_sql(TABLES[cls], cls.columns(), KEYS[cls])
+            for cls in TABLES
+            }
+
+    def open(self) -> 'SqliteWriter':
+        self.conn = db.connect(self.path, SCHEMA)
+        return self
+
+    def write(self, lic: Licence) -> None:
+        self._batch.append(lic)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write collected licences in one transaction.
+        """
+        if not self._batch:
+            return
+
+        rows = {cls: [] for cls in TABLES}
+        for lic in self._batch:
+            rows[Licence].append(lic.row())
+            rows[VykonLicence].extend(cap.row() for cap in lic.vykony)
+            for fac in lic.provozovny:
+                rows[Provozovna].append(fac.row())
+                rows[VykonProvozovna].extend(cap.row() for cap in fac.vykony)
+        ids = [(lic.id,) for lic in self._batch]
+
+        with self.conn:
+            for cls in (VykonLicence, Provozovna, VykonProvozovna):
+                self.conn.executemany(
+                    f'DELETE FROM {TABLES[cls]} WHERE lic_id = ?', ids,
+                    )
+            for cls, sql in self._sql.items():
+                self.conn.executemany(sql, rows[cls])
+
+        self._batch = []
+
+    def close(self) -> None:
+        if self.conn:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self) -> 'SqliteWriter':
+        return self.open()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
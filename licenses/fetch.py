@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+"""Concurrent download of licence pages.
+
+Blocking requests run in a thread pool driven by asyncio and share
+the connection pool of common.client. At most `concurrency` requests
+are in flight at once and pages are yielded in the same order as
+the licence ids, so the output does not depend on the order in which
+the responses arrive. Requests are paced by common.limiter, which
+lowers the number in flight and the rate when the server struggles.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, Iterator, Tuple
+
+from common.limiter import AdaptiveLimiter
+from licenses import parse
+from licenses.cache import PageCache
+
+
+# Pages per request in flight which may wait for a slower one
+REORDER = 4
+
+
+async def fetch_pages(
+    url: str, lic_ids: Iterable[str], concurrency: int,
+    cache: PageCache = None, limiter: AdaptiveLimiter = None,
+        ) -> AsyncIterator[Tuple[str, bytes]]:
+    """Yield (lic_id, page content) keeping up to concurrency requests in flight.
+
+    A new request starts whenever any request finishes, so one slow
+    request does not hold the others back. Pages which arrived ahead
+    of it wait in a buffer of at most REORDER * concurrency pages.
+    """
+    loop = asyncio.get_running_loop()
+    ids = iter(lic_ids)
+    running = {}
+    arrived = {}
+    count = 0
+    next_index = 0
+    window = REORDER * concurrency
+
+    def schedule() -> bool:
+        nonlocal count
+        lic_id = next(ids, None)
+        if lic_id is None:
+            return False
+        future = loop.run_in_executor(
+            executor, parse.request_page, url, count, {'lic-id': lic_id},
+            cache, limiter,
+            )
+        running[future] = (count, lic_id)
+        count += 1
+        return True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        exhausted = False
+        while True:
+            while (
+                not exhausted and len(running) < concurrency
+                and count - next_index < window
+                    ):
+                exhausted = not schedule()
+            if not running:
+                break
+
+            finished, _ = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED,
+                )
+            for future in finished:
+                index, lic_id = running.pop(future)
+                arrived[index] = (lic_id, future.result())
+
+            # Pages in the order of licence ids
+            while next_index in arrived:
+                yield arrived.pop(next_index)
+                next_index += 1
+
+
+def iter_pages(
+    url: str, lic_ids: Iterable[str], concurrency: int = 1,
+    cache: PageCache = None, limiter: AdaptiveLimiter = None,
+        ) -> Iterator[Tuple[str, bytes]]:
+    """Yield (lic_id, page content), serially or with fetch_pages.
+
+    Without limiter one is created from config.ini [http] allowing
+    up to concurrency requests in flight.
+    """
+    if limiter is None:
+        limiter = AdaptiveLimiter.from_config(concurrency)
+
+    if concurrency <= 1:
+        for count, lic_id in enumerate(lic_ids):
+            yield lic_id, parse.request_page(
+                url, count, {'lic-id': lic_id}, cache, limiter,
+                )
+        return
+
+    loop = asyncio.new_event_loop()
+    pages = fetch_pages(url, lic_ids, concurrency, cache, limiter)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(pages.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(pages.aclose())
+        loop.close()
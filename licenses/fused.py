@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""Licences downloaded straight from holders xml, without holders csv.
+
+Licence ids are parsed from the holders xml in a background thread
+and fed into the fetch queue of licenses.pipeline as they come,
+so the first licence pages are requested while the xml is still
+being downloaded. Holders can be written to their csv on the way.
+
+    for lic in fused.stream('electricity', url, holders_csv=path):
+        ...
+"""
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, Union
+
+from common import csvindex
+from holders import main as holders_main
+from licenses import pipeline
+from licenses.config import get_config
+from licenses.parse import Licence
+
+if TYPE_CHECKING:
+    import requests
+
+
+def holder_ids(
+    business: str, xml: Union['requests.models.Response', Path],
+    holders_csv: Path = None,
+        ) -> Iterator[str]:
+    """Yield licence ids while holders xml is being read.
+
+    With holders_csv every holder is also written to it as by
+    the holders app. The csv is replaced only when the whole xml
+    is read, an interrupted run keeps the previous one.
+    """
+    with holders_main.open_xml(xml) as (stream, encoding):
+        holders = holders_main.iter_xml(
+            stream, holders_main.business_map[business], encoding,
+            )
+        if holders_csv:
+            holders_csv.parent.mkdir(parents=True, exist_ok=True)
+            tmp = holders_csv.with_name(holders_csv.name + '.tmp')
+            holders = holders_main.tee_csv(holders, tmp)
+        for holder in holders:
+            yield holder.id
+
+    if holders_csv:
+        csvindex.replace(tmp, holders_csv)
+
+
+def open_holders(
+    business: str, offline: bool = False
+        ) -> Union['requests.models.Response', Path]:
+    """Streamed response with holders xml or sample xml when offline.
+    """
+    if offline:
+        return holders_main.sample_xml(business)
+    return holders_main.get_xml(
+        get_config().get('holders', 'url'), holders_main.business_map[business],
+        )
+
+
+def stream_ids(
+    business: str, holders_csv: Path = None, offline: bool = False,
+        ) -> Iterator[str]:
+    """Licence ids of business (e.g. electricity) parsed in a background thread.
+    """
+    return pipeline.threaded(
+        holder_ids(business, open_holders(business, offline), holders_csv),
+        name='holders',
+        )
+
+
+def stream(
+    business: str, url: str, holders_csv: Path = None, offline: bool = False,
+    **kwargs,
+        ) -> Iterator[Licence]:
+    """Yield parsed licences of business (e.g. electricity) from holders xml.
+
+    Other keyword arguments are passed to pipeline.stream.
+    """
+    ids = stream_ids(business, holders_csv, offline)
+    return pipeline.stream(holders_main.business_map[business], ids, url, **kwargs)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""Incremental refresh of licences.
+
+The holders csv used by the last successful run is kept next to
+the licenses output as a snapshot. Comparing the current holders csv
+with the snapshot tells which licences are new or changed their
+version or status. Only these are requested again, rows of the other
+licences are carried forward from the previous output.
+"""
+
+import csv
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+from licenses import output
+from licenses.output import open_csv
+
+
+SNAPSHOT = 'holders_snapshot.csv'
+
+# Column with licence id in each output csv by filename
+ID_COLUMNS = {
+    filename: output.ID_COLUMNS[cls]
+    for cls, filename in output.CsvWriter(Path()).filenames.items()
+}
+
+
+def read_versions(csv_path: Path) -> Dict[str, Tuple[str, str]]:
+    """Return mapping from licence id to (version, status).
+    """
+    try:
+        with open(csv_path) as csvf:
+            reader = csv.DictReader(csvf)
+            return {
+                row['id']: (row['version'], row['status']) for row in reader
+                }
+    except FileNotFoundError:
+        return {}
+
+
+def plan(holders_csv: Path, output_dir: Path) -> Tuple[List[str], Set[str]]:
+    """Return ids to request and ids whose rows are carried forward.
+    """
+    current = read_versions(holders_csv)
+    previous = read_versions(output_dir / SNAPSHOT)
+
+    changed = [
+        lic_id for lic_id, version in current.items()
+        if previous.get(lic_id) != version
+        ]
+    unchanged = set(current) - set(changed)
+
+    return changed, unchanged
+
+
+def carry_forward(
+    output_dir: Path, keep: Set[str], compress: bool = False
+        ) -> None:
+    """Drop rows of licences which are not in keep from the output csvs.
+    """
+    suffix = '.gz' if compress else ''
+    for filename, id_column in ID_COLUMNS.items():
+        path = output_dir / (filename + suffix)
+        if not path.exists():
+            continue
+
+        tmp_path = output_dir / ('tmp-' + path.name)
+        with open_csv(path) as src, open_csv(tmp_path, 'w') as dst:
+            reader = csv.DictReader(src)
+            writer = csv.DictWriter(dst, fieldnames=reader.fieldnames)
+            writer.writeheader()
+            for row in reader:
+                if row[id_column] in keep:
+                    writer.writerow(row)
+        os.replace(tmp_path, path)
+
+
+def save_snapshot(holders_csv: Path, output_dir: Path) -> None:
+    """Remember holders csv used for this run.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(holders_csv, output_dir / SNAPSHOT)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""Progress journal of a licences run.
+
+After rows of a licence are written and flushed, its id and sizes
+of the output csvs are appended to the journal as one json line.
+A resumed run skips the journaled ids and first truncates the csvs
+to the sizes from the last journal entry. Rows of a licence which
+was only partly written before the crash are removed this way
+and never duplicated.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+
+JOURNAL = 'journal.jsonl'
+
+
+class Journal:
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+
+    def read(self) -> Tuple[Set[str], Optional[Dict[str, int]]]:
+        """Return journaled ids and sizes of csvs from the last entry.
+        """
+        done = set()
+        sizes = None
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    # Incomplete last line of interrupted run
+                    if not line.endswith('\n'):
+                        break
+                    entry = json.loads(line)
+                    if entry['id'] is not None:
+                        done.add(entry['id'])
+                    sizes = entry['sizes']
+        except FileNotFoundError:
+            pass
+        return done, sizes
+
+    def open(self, append: bool = False) -> 'Journal':
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a' if append else 'w')
+        return self
+
+    def record(self, lic_id: Optional[str], sizes: Dict[str, int]) -> None:
+        """Record licence whose rows are written, None marks a checkpoint.
+        """
+        self._file.write(json.dumps({'id': lic_id, 'sizes': sizes}) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def truncate(output_dir: Path, sizes: Dict[str, int]) -> None:
+    """Cut off rows written after the last journal entry.
+    """
+    for filename, size in sizes.items():
+        path = output_dir / filename
+        if path.exists() and path.stat().st_size > size:
+            os.truncate(path, size)
@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 
-from configparser import Error
+import contextlib
 import csv
+import glob
 import pathlib
+import sys
 from typing import List
 import argparse
 
 
-from licenses.config import conf
-from licenses import parse
+from common import client, csvindex, metrics
+from common.limiter import AdaptiveLimiter
+from licenses.config import get_config
+from licenses import address, incremental, parse, pipeline, workqueue
+from licenses.cache import PageCache
+from licenses.db import SqliteWriter
+from licenses.journal import JOURNAL, Journal, truncate
+from licenses.output import CsvWriter, open_csv, read_licence
 
 
 def read_lic_ids(business: str) -> List[str]:
@@ -20,38 +28,27 @@ def read_lic_ids(business: str) -> List[str]:
 
 def read_lic_count(business: str) -> int:
     csv_path = pathlib.Path(f'csvs/holders/{business}/holders.csv')
-
-    with open(csv_path) as csvf:
-        reader = csv.DictReader(csvf)
-        return len(list(reader))
+    # From the index of holders csv if it is up to date
+    return csvindex.count_rows(csv_path)
 
 
 def get_data(
-    business: str, lic_ids: List, url: str, start: int, end: int
+    business: str, lic_ids: List, url: str, start: int, end: int,
+    concurrency: int = 1, cache: PageCache = None, parse_workers: int = 1,
         ) -> List[parse.Licence]:
 
-    count = 0
-
-    lic_list = []
-
-    for lic_id in lic_ids[start:end]:
-        params = {'lic-id': lic_id}
-        try:
-            soup = parse.request_soup(url, count, params=params)
-            parsed_lic = parse.parse_page(business, lic_id, soup)
-        except Error as e:
-            print(e)
-            print(f'Error occured when parsing id {lic_id}')
-            print(f'for {business} at index {lic_ids.index(lic_id)}')
-            raise SystemExit
-
-        lic_list.append(parsed_lic)
+    return list(pipeline.stream(
+        business, lic_ids, url, start, end, concurrency, cache,
+        parse_workers=parse_workers,
+        ))
 
-        count += 1
-        if count % 500 == 0:
-            print(f'Parsed {count} licenses')
 
-    return lic_list
+def record_written(lic: parse.Licence, output: str) -> None:
+    """Count licence and its rows in all tables as written.
+    """
+    rows = 1 + len(lic.vykony) + sum(1 + len(fac.vykony) for fac in lic.provozovny)
+    metrics.inc('written_total', output=output)
+    metrics.inc('rows_written_total', rows, output=output)
 
 
 def get_parser() -> None:
@@ -65,7 +62,14 @@ def get_parser() -> None:
         '--dev',
         action='store_true',
         default=False,
-        help='use downloaded html file in samples dir (default: False)'
+        help='use only pages cached by previous runs, no requests (default: False)'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        default=False,
+        help='do not cache downloaded pages on disk (default: False)'
     )
 
     parser.add_argument(
@@ -75,6 +79,29 @@ def get_parser() -> None:
         help='export parsed data to csv (default: True)'
     )
 
+    parser.add_argument(
+        '--gzip',
+        action='store_true',
+        default=False,
+        help='compress exported csv files with gzip (default: False)'
+    )
+
+    parser.add_argument(
+        '--sqlite',
+        metavar='FILENAME',
+        action='store',
+        default=None,
+        help='export parsed data to SQLite database instead of csv (default: None)'
+    )
+
+    parser.add_argument(
+        '--parquet',
+        metavar='DIRECTORY',
+        action='store',
+        default=None,
+        help='export parsed data to partitioned Parquet instead of csv (default: None)'
+    )
+
     parser.add_argument(
         '--business',
         action='store',
@@ -103,9 +130,302 @@ def get_parser() -> None:
         help='specify end index for parsing license ids (default: None)'
     )
 
+    parser.add_argument(
+        '--concurrency',
+        default=1,
+        type=int,
+        metavar='N',
+        help='number of requests in flight at once (default: 1)'
+    )
+
+    parser.add_argument(
+        '--parse-workers',
+        default=1,
+        type=int,
+        metavar='N',
+        help='number of processes parsing pages (default: 1)'
+    )
+
+    parser.add_argument(
+        '--backend',
+        action='store',
+        choices=['bs4', 'lxml'],
+        default='bs4',
+        help='select html parser, lxml is faster (default: bs4)'
+    )
+
+    parser.add_argument(
+        '--psc-index',
+        metavar='PATTERN',
+        default=None,
+        help='holders csvs filling in okres and kraj by PSČ, glob pattern '
+             '(default: config.ini [address] psc_index)'
+    )
+
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        default=False,
+        help='request only licenses new or changed since the last run (default: False)'
+    )
+
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        default=False,
+        help='continue interrupted run, skip licenses already written (default: False)'
+    )
+
+    parser.add_argument(
+        '--from-holders',
+        action='store_true',
+        default=False,
+        help='read license ids from holders xml while it is downloaded '
+             'and write holders csv on the way (default: False)'
+    )
+
+    parser.add_argument(
+        '--max-rps',
+        metavar='N',
+        default=None,
+        type=float,
+        help='ceiling of requests per second, 0 for none (default: config.ini [http] max_rps)'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        metavar='FILENAME',
+        action='store',
+        default=None,
+        help='write metrics of fetch, parse and write periodically, '
+             'json or Prometheus text for .prom (default: None)'
+    )
+
+    parser.add_argument(
+        '--metrics-interval',
+        metavar='SECONDS',
+        default=10.0,
+        type=float,
+        help='seconds between metrics snapshots (default: 10.0)'
+    )
+
+    # Commands
+    subparsers = parser.add_subparsers(dest='command')
+
+    report = subparsers.add_parser(
+        'report',
+        description='Installed capacity by technologie, kraj and okres, '
+                    'percentiles and top facilities from exported csvs',
+        help='report installed capacity from exported csvs',
+    )
+
+    report.add_argument(
+        '--business',
+        action='store',
+        choices=['electricity', 'heat'],
+        default=argparse.SUPPRESS,
+        help='select business type (default: electricity)'
+    )
+
+    report.add_argument(
+        '--druh',
+        action='store',
+        choices=['Elektrický', 'Tepelný'],
+        default='Elektrický',
+        help='select electric or heat capacity (default: Elektrický)'
+    )
+
+    report.add_argument(
+        '--top',
+        default=10,
+        type=int,
+        metavar='N',
+        help='number of largest facilities (default: 10)'
+    )
+
+    queue_help = 'SQLite database with the work queue (default: config.ini [queue] path)'
+
+    enqueue = subparsers.add_parser(
+        'enqueue',
+        description='Split license ids from holders csv into shards of the work queue',
+        help='split license ids into shards of the work queue',
+    )
+
+    enqueue.add_argument(
+        '--queue',
+        metavar='FILENAME',
+        default=None,
+        help=queue_help
+    )
+
+    enqueue.add_argument(
+        '--business',
+        action='store',
+        choices=['electricity', 'heat'],
+        default=argparse.SUPPRESS,
+        help='select business type (default: electricity)'
+    )
+
+    enqueue.add_argument(
+        '--shard-size',
+        default=workqueue.SHARD_SIZE,
+        type=int,
+        metavar='N',
+        help=f'number of licenses in a shard (default: {workqueue.SHARD_SIZE})'
+    )
+
+    worker = subparsers.add_parser(
+        'worker',
+        description='Claim shards of the work queue and write their csvs '
+                    'until all shards are done',
+        help='process shards of the work queue',
+    )
+
+    worker.add_argument(
+        '--queue',
+        metavar='FILENAME',
+        default=None,
+        help=queue_help
+    )
+
+    worker.add_argument(
+        '--name',
+        default=None,
+        help='name of the worker, unique across machines (default: hostname-pid)'
+    )
+
+    worker.add_argument(
+        '--lease',
+        default=workqueue.LEASE,
+        type=float,
+        metavar='SECONDS',
+        help=f'lease of a claimed shard, renewed while working (default: {workqueue.LEASE})'
+    )
+
+    merge = subparsers.add_parser(
+        'merge',
+        description='Join csvs of shards done by all workers into the output csvs',
+        help='join csvs of done shards',
+    )
+
+    merge.add_argument(
+        '--queue',
+        metavar='FILENAME',
+        default=None,
+        help=queue_help
+    )
+
+    merge.add_argument(
+        '--business',
+        action='store',
+        choices=['electricity', 'heat'],
+        default=argparse.SUPPRESS,
+        help='select business type (default: electricity)'
+    )
+
+    show = subparsers.add_parser(
+        'show',
+        description='Print rows of licenses from exported csvs, '
+                    'found by the index without reading whole csvs',
+        help='print rows of licenses from exported csvs',
+    )
+
+    show.add_argument(
+        'lic_id',
+        help='license id, first one with --last'
+    )
+
+    show.add_argument(
+        '--last',
+        metavar='LIC_ID',
+        default=None,
+        help='print all licenses from lic_id to this id (default: None)'
+    )
+
+    show.add_argument(
+        '--business',
+        action='store',
+        choices=['electricity', 'heat'],
+        default=argparse.SUPPRESS,
+        help='select business type (default: electricity)'
+    )
+
     return parser
 
 
+def show_licenses(output_dir: pathlib.Path, first: str, last: str = None) -> int:
+    """Print rows of licenses from first to last id, return their number.
+    """
+    lic_ids = [first]
+    if last is not None:
+        licenses_csv = output_dir / 'licenses.csv'
+        if not licenses_csv.exists():
+            licenses_csv = output_dir / 'licenses.csv.gz'
+        index = csvindex.CsvIndex.open(licenses_csv)
+        if index is None:
+            with open_csv(licenses_csv) as csvf:
+                lic_ids = sorted(
+                    {row['id'] for row in csv.DictReader(csvf)
+                     if int(first) <= int(row['id']) <= int(last)},
+                    key=int,
+                    )
+        else:
+            with index:
+                lic_ids = index.between(first, last)
+
+    writer = csv.writer(sys.stdout)
+    for lic_id in lic_ids:
+        for filename, rows in read_licence(output_dir, lic_id).items():
+            for row in rows:
+                writer.writerow([filename, *row.values()])
+    return len(lic_ids)
+
+
+def run_queue_command(
+    args: dict, business_map: dict, limiter: AdaptiveLimiter,
+        ) -> None:
+    business = args['business']
+    path = args['queue'] or get_config().get('queue', 'path', fallback='csvs/licenses/queue.db')
+
+    with workqueue.WorkQueue(path) as queue:
+        if args['command'] == 'enqueue':
+            shards = queue.enqueue(
+                business, read_lic_ids(business), args['shard_size'],
+                )
+            print(f'{shards} shards of {args["shard_size"]} licenses for {business} in {path}')
+
+        elif args['command'] == 'merge':
+            output_dir = pathlib.Path(f'csvs/licenses/{business}')
+            shards = workqueue.merge(queue, business, output_dir)
+            print(f'Merged {shards} shards into {output_dir}, {queue.progress(business)}')
+
+        else:
+            cache = None
+            if args['dev'] or not args['no_cache']:
+                cache = PageCache(
+                    get_config().get('cache', 'directory', fallback='cache/licenses'),
+                    offline=args['dev'],
+                    )
+            url = get_config().get('licenses', 'url')
+
+            def stream(shard):
+                return pipeline.stream(
+                    business_map[shard.business], shard.lic_ids, url,
+                    concurrency=args['concurrency'],
+                    cache=cache,
+                    parse_workers=args['parse_workers'],
+                    backend=args['backend'],
+                    limiter=limiter,
+                    )
+
+            shards = workqueue.run_worker(
+                queue, args['name'] or workqueue.default_worker(), stream,
+                lambda shard: pathlib.Path(f'csvs/licenses/{shard.business}'),
+                args['lease'],
+                )
+            print(f'Worker done, processed {shards} shards')
+
+
 def main() -> None:
 
     # Mapping from names used in the directory tree
@@ -118,6 +438,55 @@ def main() -> None:
 
     business = args['business']
 
+    # Table PSČ -> okres, kraj for addresses of facilities
+    pattern = args['psc_index'] or get_config().get(
+        'address', 'psc_index', fallback='csvs/holders/*/holders.csv',
+        )
+    psc_paths = sorted(glob.glob(pattern))
+    parses = args['command'] in (None, 'worker') and not args['count']
+    if not psc_paths and parses:
+        print(f'No holders csv matches {pattern}, okres and kraj missing '
+              'in addresses are not filled in by PSČ')
+    address.use_psc_index(psc_paths)
+
+    # Report from data exported before, no requests
+    if args['command'] == 'report':
+        from licenses.report import CapacityStore, print_report
+        store = CapacityStore.from_csv(pathlib.Path(f'csvs/licenses/{business}'))
+        print_report(store, args['druh'], args['top'])
+        return
+
+    # Rows of exported licenses, no requests
+    if args['command'] == 'show':
+        show_licenses(
+            pathlib.Path(f'csvs/licenses/{business}'), args['lic_id'], args['last'],
+            )
+        return
+
+    # Connection pool must keep all requests in flight,
+    # otherwise connections above its size are dropped after use
+    pool_size = get_config().getint('http', 'pool_size', fallback=10)
+    if parses and args['concurrency'] > pool_size:
+        client.reset_session(args['concurrency'])
+
+    # Requests in flight and their rate adapt to responses of the server
+    limiter = AdaptiveLimiter.from_config(args['concurrency'])
+    if args['max_rps'] is not None:
+        limiter = AdaptiveLimiter(
+            args['concurrency'], args['max_rps'], limiter.retries,
+            )
+
+    # Snapshots of metrics are written while the licences are downloaded
+    exporter = contextlib.nullcontext()
+    if args['metrics']:
+        exporter = metrics.Exporter(args['metrics'], args['metrics_interval'])
+
+    # Shards of the work queue shared by workers on several machines
+    if args['command'] in ('enqueue', 'worker', 'merge'):
+        with exporter:
+            run_queue_command(args, business_map, limiter)
+        return
+
     # Case when exploring number of licenses before requesting data
     if args['count']:
         count = read_lic_count(business)
@@ -128,23 +497,112 @@ def main() -> None:
     start = args['start']
     end = args['end']
 
-    # First read license numbers for particular business
-    lic_ids = read_lic_ids(business)
-    url = conf.get('licenses', 'url')
-
-    # Use these numbers to request data for licenses
-    parsed_licenses = get_data(
-        business_map[business],
-        lic_ids,
-        url,
-        start=start,
-        end=end
-        )
+    output_dir = pathlib.Path(f'csvs/licenses/{business}')
+    holders_csv = pathlib.Path(f'csvs/holders/{business}/holders.csv')
 
-    if args['csv']:
-        for lic in parsed_licenses:
-            output_dir = pathlib.Path(f'csvs/licenses/{business}')
-            lic.to_csv(output_dir, 'licenses.csv')
+    # Licence ids come straight from holders xml, holders csv is written
+    # on the way, see licenses.fused
+    if args['from_holders']:
+        if args['incremental'] or args['resume'] or start or end is not None:
+            print('--from-holders works on all licenses, '
+                  'omit --incremental, --resume, --start and --end')
+            raise SystemExit
+        from licenses import fused
+        lic_ids = fused.stream_ids(business, holders_csv, offline=args['dev'])
+    # First read license numbers for particular business
+    # or only those which changed since the last run
+    elif args['incremental']:
+        if start or end is not None:
+            print('--incremental works on all licenses, omit --start/--end')
+            raise SystemExit
+        # Rows of unchanged licenses are carried forward only in csvs
+        if args['sqlite'] or args['parquet']:
+            print('--incremental works only with csv output, omit --sqlite/--parquet')
+            raise SystemExit
+        lic_ids, unchanged = incremental.plan(holders_csv, output_dir)
+        print(f'{len(lic_ids)} new or changed licenses for {business}')
+    else:
+        lic_ids = read_lic_ids(business)
+    url = get_config().get('licenses', 'url')
+
+    # Skip licenses written by the interrupted run
+    # and remove rows of the licence it did not finish
+    done = set()
+    if args['resume']:
+        if args['gzip']:
+            print('--resume is not supported with --gzip')
+            raise SystemExit
+        # Journal is kept only with csv output
+        if args['sqlite'] or args['parquet']:
+            print('--resume works only with csv output, omit --sqlite/--parquet')
+            raise SystemExit
+        done, sizes = Journal(output_dir / JOURNAL).read()
+        if sizes:
+            truncate(output_dir, sizes)
+        lic_ids = [lic_id for lic_id in lic_ids[start:end] if lic_id not in done]
+        start, end = 0, None
+        print(f'Resuming, {len(done)} licenses already written')
+
+    # Pages from previous runs are reused if they did not change,
+    # with --dev only the cached pages are used without any request
+    cache = None
+    if args['dev'] or not args['no_cache']:
+        cache = PageCache(
+            get_config().get('cache', 'directory', fallback='cache/licenses'),
+            offline=args['dev'],
+            )
+
+    with exporter:
+        # Use these numbers to request data for licenses,
+        # every licence is written as soon as it is parsed
+        parsed_licenses = pipeline.stream(
+            business_map[business],
+            lic_ids,
+            url,
+            start=start,
+            end=end,
+            concurrency=args['concurrency'],
+            cache=cache,
+            parse_workers=args['parse_workers'],
+            backend=args['backend'],
+            limiter=limiter,
+            )
+
+        if args['parquet']:
+            from licenses.parquet import ParquetWriter
+            with ParquetWriter(args['parquet'], business) as writer:
+                for lic in parsed_licenses:
+                    with metrics.timer('write_seconds', output='parquet'):
+                        writer.write(lic)
+                    record_written(lic, 'parquet')
+        elif args['sqlite']:
+            # Licences replace their previous rows, no journal needed
+            with SqliteWriter(args['sqlite']) as writer:
+                for lic in parsed_licenses:
+                    with metrics.timer('write_seconds', output='sqlite'):
+                        writer.write(lic)
+                    record_written(lic, 'sqlite')
+        elif args['csv']:
+            if args['incremental']:
+                keep = unchanged | done
+                incremental.carry_forward(output_dir, keep, args['gzip'])
+
+            # Every written licence is journaled, so that an interrupted run
+            # can continue with --resume
+            journal = Journal(output_dir / JOURNAL).open(append=args['resume'])
+            with CsvWriter(output_dir, compress=args['gzip']) as writer, journal:
+                journal.record(None, writer.sizes())
+                for lic in parsed_licenses:
+                    with metrics.timer('write_seconds', output='csv'):
+                        writer.write(lic)
+                        journal.record(lic.id, writer.sizes())
+                    record_written(lic, 'csv')
+        else:
+            for lic in parsed_licenses:
+                pass
+
+    if args['incremental']:
+        incremental.save_snapshot(holders_csv, output_dir)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""Buffered csv output of parsed licences.
+
+CsvWriter keeps all four csv files (licenses, capacities, facilities
+and facilities_capacities) open for the whole run instead of opening
+a file for every single row. Rows are taken directly from attributes
+in the order of precomputed columns, optionally gzip compressed.
+
+When closed, CsvWriter writes the sidecar index of licence ids
+(common.csvindex) next to every plain csv, so rows of one licence
+can be read without parsing the whole csv, see read_licence.
+Without index the old index is left stale and not used.
+"""
+
+import csv
+import gzip
+import os
+from pathlib import Path
+from typing import IO, Dict, List
+
+from common import csvindex
+from licenses.parse import Licence, Provozovna, VykonLicence, VykonProvozovna
+
+
+BUFFER_SIZE = 1 << 16
+
+# Column with licence id in each csv
+ID_COLUMNS = {
+    Licence: 'id',
+    VykonLicence: 'lic_id',
+    Provozovna: 'lic_id',
+    VykonProvozovna: 'lic_id',
+}
+
+
+def open_csv(path: Path, mode: str = 'r') -> IO:
+    """Open plain or gzip compressed (.gz) csv file in text mode.
+    """
+    if path.suffix == '.gz':
+        return gzip.open(path, mode + 't', newline='', encoding='utf-8')
+    return open(path, mode, newline='', buffering=BUFFER_SIZE, encoding='utf-8')
+
+
+class CsvWriter:
+
+    def __init__(
+        self, output_dir: Path, filename: str = 'licenses.csv',
+        compress: bool = False, index: bool = True,
+            ):
+        self.output_dir = Path(output_dir)
+        suffix = '.gz' if compress else ''
+        self.filenames = {
+            Licence: filename + suffix,
+            VykonLicence: 'capacities.csv' + suffix,
+            Provozovna: 'facilities.csv' + suffix,
+            VykonProvozovna: 'facilities_capacities.csv' + suffix,
+        }
+        self.compress = compress
+        self.index = index
+        self._files = []
+        self._writers = {}
+        self._stats = {}
+
+    def open(self) -> 'CsvWriter':
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        for cls, filename in self.filenames.items():
+            path = self.output_dir / filename
+            header = not path.exists() or path.stat().st_size == 0
+            self._stats[cls] = csvindex.csv_stat(path)
+
+            csvf = open_csv(path, 'a')
+            self._files.append(csvf)
+            writer = csv.writer(csvf)
+            if header:
+                writer.writerow(cls.columns())
+            self._writers[cls] = writer.writerow
+
+        return self
+
+    def write(self, lic: Licence) -> None:
+        """Write rows of licence, its capacities and facilities.
+        """
+        writers = self._writers
+
+        writers[Licence](lic.row())
+
+        write_cap = writers[VykonLicence]
+        for cap in lic.vykony:
+            write_cap(cap.row())
+
+        write_fac = writers[Provozovna]
+        write_fac_cap = writers[VykonProvozovna]
+        for fac in lic.provozovny:
+            write_fac(fac.row())
+            for fac_cap in fac.vykony:
+                write_fac_cap(fac_cap.row())
+
+    def flush(self) -> None:
+        for csvf in self._files:
+            csvf.flush()
+
+    def sizes(self) -> Dict[str, int]:
+        """Flush all files and return their sizes in bytes.
+        """
+        self.flush()
+        return {
+            filename: os.fstat(csvf.fileno()).st_size
+            for filename, csvf in zip(self.filenames.values(), self._files)
+            }
+
+    def close(self) -> None:
+        for csvf in self._files:
+            csvf.close()
+        if self._files and self.index and not self.compress:
+            # Only rows appended by this writer are read
+            for cls, filename in self.filenames.items():
+                csvindex.build(
+                    self.output_dir / filename, ID_COLUMNS[cls], self._stats[cls],
+                    )
+        self._files = []
+        self._writers = {}
+
+    def __enter__(self) -> 'CsvWriter':
+        return self.open()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_licence(output_dir: Path, lic_id: str) -> Dict[str, List[dict]]:
+    """Rows of licence in every csv of output_dir by filename.
+
+    Rows are found by the index, csv without a valid index is read whole
+    (always the case of csv.gz written with compress).
+    """
+    rows = {}
+    for cls, filename in CsvWriter(output_dir).filenames.items():
+        path = Path(output_dir) / filename
+        if not path.exists():
+            path = Path(output_dir) / (filename + '.gz')
+        if not path.exists():
+            continue
+        index = csvindex.CsvIndex.open(path)
+        if index is not None:
+            with index:
+                rows[filename] = index.lookup(lic_id)
+        else:
+            with open_csv(path) as f:
+                rows[filename] = [
+                    row for row in csv.DictReader(f) if row[ID_COLUMNS[cls]] == lic_id
+                    ]
+    return rows
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Export of parsed licences to partitioned Parquet.
+
+ParquetWriter can be used in place of CsvWriter. Each of the four
+tables is a dataset partitioned by business, facilities and their
+capacities also by kraj of the facility. Licences and their total
+capacities have no single kraj, they are partitioned by business only.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Union
+
+import pyarrow as pa
+
+from common.parquet import DICTIONARY, write_dataset
+from licenses.parse import Licence
+
+
+BATCH_SIZE = 5000
+
+SCHEMAS = {
+    'licenses': pa.schema([
+        ('id', pa.string()),
+        ('predmet', DICTIONARY),
+        ('pocet_zdroju', pa.int32()),
+        ('business', pa.string()),
+    ]),
+    'capacities': pa.schema([
+        ('lic_id', pa.string()),
+        ('druh', DICTIONARY),
+        ('technologie', DICTIONARY),
+        ('mw', pa.float64()),
+        ('business', pa.string()),
+    ]),
+    'facilities': pa.schema([
+        ('id', pa.int32()),
+        ('lic_id', pa.string()),
+        ('nazev', pa.string()),
+        ('ulice', pa.string()),
+        ('cp', pa.string()),
+        ('psc', pa.string()),
+        ('obec', pa.string()),
+        ('okres', DICTIONARY),
+        ('kraj', DICTIONARY),
+        ('pocet_zdroju', pa.int32()),
+        ('katastralni_uzemi', pa.string()),
+        ('kod_katastru', pa.string()),
+        ('vymezeni', pa.string()),
+        ('business', pa.string()),
+    ]),
+    'facilities_capacities': pa.schema([
+        ('provozovna_id', pa.int32()),
+        ('lic_id', pa.string()),
+        ('druh', DICTIONARY),
+        ('technologie', DICTIONARY),
+        ('mw', pa.float64()),
+        ('okres', DICTIONARY),
+        ('kraj', DICTIONARY),
+        ('business', pa.string()),
+    ]),
+}
+
+PARTITIONS = {
+    'licenses': ('business',),
+    'capacities': ('business',),
+    'facilities': ('business', 'kraj'),
+    'facilities_capacities': ('business', 'kraj'),
+}
+
+
+class ParquetWriter:
+
+    def __init__(
+        self, root: Union[str, Path], business: str,
+        batch_size: int = BATCH_SIZE,
+            ):
+        self.root = Path(root)
+        self.business = business
+        self.batch_size = batch_size
+        self._count = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._columns: Dict[str, Dict[str, List]] = {
+            table: {name: [] for name in schema.names}
+            for table, schema in SCHEMAS.items()
+            }
+
+    def _append(self, table: str, row: dict) -> None:
+        for name, values in self._columns[table].items():
+            values.append(row.get(name))
+
+    def open(self) -> 'ParquetWriter':
+        return self
+
+    def write(self, lic: Licence) -> None:
+        business = self.business
+
+        self._append('licenses', {**lic.__dict__, 'business': business})
+        for cap in lic.vykony:
+            self._append('capacities', {**cap.__dict__, 'business': business})
+        for fac in lic.provozovny:
+            self._append('facilities', {**fac.__dict__, 'business': business})
+            location = {'okres': fac.okres, 'kraj': fac.kraj, 'business': business}
+            for cap in fac.vykony:
+                self._append('facilities_capacities', {**cap.__dict__, **location})
+
+        self._count += 1
+        if self._count >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write collected rows as new parts of the datasets.
+        """
+        for table, columns in self._columns.items():
+            write_dataset(
+                columns, SCHEMAS[table], self.root / table, PARTITIONS[table],
+                )
+        self._count = 0
+        self._reset()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> 'ParquetWriter':
+        return self.open()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
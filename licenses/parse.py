@@ -13,24 +13,49 @@ HTML není konzistentní, např. <th> a <td>, identifikace <table>
 jednou jako id, jindy jako class.
 """
 
+import time
 import unicodedata
-from dataclasses import dataclass, field, fields, asdict
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Callable, List, Tuple, Union
 import csv
 
 
-import bs4
-import requests
-from bs4 import BeautifulSoup
-
+from common import client, metrics
+from common.limiter import RETRY_STATUSES, AdaptiveLimiter, backoff
 from licenses import address
-from licenses.config import conf
+from licenses.cache import PageCache
+
+# bs4 and requests are imported on first use, they slow down startup
+if TYPE_CHECKING:
+    import bs4
 
 
 @dataclass
 class Base:
 
+    @classmethod
+    @lru_cache(maxsize=None)
+    def columns(cls) -> Tuple[str, ...]:
+        """Names of the fields exported to csv (without nested lists).
+        """
+        return tuple(
+            field.name for field in fields(cls)
+            if not field.default_factory == list
+            )
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _row_getter(cls) -> Callable:
+        return attrgetter(*cls.columns())
+
+    def row(self) -> tuple:
+        """Values of the exported fields in the order of columns.
+        """
+        return self._row_getter()(self)
+
     def to_csv(self, output_dir: Path, filename: str) -> None:
         if (output_dir / filename).exists():
             header = False
@@ -40,18 +65,12 @@ class Base:
         output_dir.mkdir(parents=True, exist_ok=True)
 
         with open(output_dir / filename, 'a') as csvf:
-            fieldnames = [
-                field.name for field in fields(self)
-                if not field.default_factory == list
-                ]
-            writer = csv.DictWriter(
-                csvf, fieldnames=fieldnames, extrasaction='ignore',
-                )
+            writer = csv.writer(csvf)
 
             if header:
-                writer.writeheader()
+                writer.writerow(self.columns())
 
-            writer.writerow(asdict(self))
+            writer.writerow(self.row())
 
 
 @dataclass
@@ -111,71 +130,183 @@ class Licence(Base):
         self.vykony.append(capacity)
 
     def to_csv(self, output_dir: Path, filename: str = 'licenses.csv') -> None:
-        super().to_csv(output_dir, filename)
+        """Append rows of this licence, use CsvWriter for many licences.
+
+        The csv index is not updated, next CsvWriter rebuilds it.
+        """
+        from licenses.output import CsvWriter
 
-        for cap in self.vykony:
-            cap.to_csv(output_dir, 'capacities.csv')
+        with CsvWriter(output_dir, filename, index=False) as writer:
+            writer.write(self)
 
-        for fac in self.provozovny:
-            fac.to_csv(output_dir, 'facilities.csv')
-            for fac_cap in fac.vykony:
-                fac_cap.to_csv(output_dir, 'facilities_capacities.csv')
 
+def request_page(
+    url: str, count: int, params: dict, cache: PageCache = None,
+    limiter: AdaptiveLimiter = None,
+        ) -> bytes:
+    """Request page and return its raw content
 
-def request_soup(url: str, count: int, params: dict) -> bs4.BeautifulSoup:
-    """Request page and retur BeautifulSoup from its text
+    With cache the page is requested only if it changed since the last
+    run and in offline mode it is not requested at all. With limiter
+    requests wait for their turn and failed ones are requested again.
     """
-    headers = {'User-Agent': conf.get('headers', 'user_agent')}
-    try:
-        r = requests.get(url, params=params, headers=headers, timeout=3)
-    except requests.exceptions.RequestException as e:
+    lic_id = params['lic-id']
+    cached = cache.load(lic_id, url) if cache else None
+
+    if cache and cache.offline:
+        if cached is None:
+            print(f'License id {lic_id} is not in cache {cache.directory}')
+            raise SystemExit
+        metrics.inc('cache_hits_total')
+        return cached.content
+
+    import requests
+
+    headers = cached.conditional_headers() if cached else {}
+    attempts = 1 + (limiter.retries if limiter else 0)
+    for attempt in range(attempts):
+        if attempt:
+            metrics.inc('fetch_retries_total')
+            time.sleep(backoff(attempt - 1))
+
+        if limiter:
+            limiter.acquire()
+        start = time.perf_counter()
+        try:
+            r = client.get(url, params=params, headers=headers)
+        except requests.exceptions.RequestException as e:
+            if limiter:
+                limiter.release(error=True)
+            metrics.inc('fetch_errors_total', error=type(e).__name__)
+            if attempt + 1 < attempts:
+                continue
+            print(f'Request failed handling license # {count}')
+            print(f'License id: {lic_id}')
+            print(e)
+            raise SystemExit
+
+        elapsed = time.perf_counter() - start
+        if limiter:
+            limiter.release(r.status_code, elapsed, r.headers.get('Retry-After'))
+        metrics.observe('fetch_seconds', elapsed)
+        metrics.inc('fetch_responses_total', status=r.status_code)
+        metrics.inc('fetch_bytes_total', len(r.content))
+
+        if r.status_code not in RETRY_STATUSES:
+            break
+    else:
+        # Body of an error response is not a licence page
         print(f'Request failed handling license # {count}')
-        print(f'License id: {params["lic-id"]}')
-        print(e)
+        print(f'License id: {lic_id}')
+        print(f'Status {r.status_code} after {attempts} attempts')
         raise SystemExit
-    r.encoding = 'utf-8'
-    return BeautifulSoup(r.text, 'html.parser')
 
+    if r.status_code == 304 and cached:
+        metrics.inc('cache_hits_total')
+        return cached.content
+
+    if cache and r.status_code == 200:
+        cache.store(
+            lic_id, url, r.content,
+            etag=r.headers.get('ETag'),
+            last_modified=r.headers.get('Last-Modified'),
+            )
+    return r.content
+
+
+def request_soup(
+    url: str, count: int, params: dict, cache: PageCache = None
+        ) -> 'bs4.BeautifulSoup':
+    """Request page and retur BeautifulSoup from its content
+    """
+    return make_soup(request_page(url, count, params, cache))
+
+
+def make_soup(content: Union[bytes, str]) -> 'bs4.BeautifulSoup':
+    """Return BeautifulSoup from content of the page
+
+    Pages on licence.eru.cz are in utf-8.
+    """
+    from bs4 import BeautifulSoup
+
+    if isinstance(content, bytes):
+        return BeautifulSoup(content, 'html.parser', from_encoding='utf-8')
+    return BeautifulSoup(content, 'html.parser')
 
-def parse_capacity(table: bs4.BeautifulSoup) -> dict:
+
+@dataclass(frozen=True)
+class Tree:
+    """Lookups in the parsed page of one backend (bs4 or lxml).
+
+    Licence is built from the page by the same code for both backends,
+    only these functions differ.
+    """
+
+    rows: Callable       # <tr> of a table
+    cells: Callable      # <th> and <td> of a row
+    th: Callable
+    td: Callable
+    divs: Callable
+    text: Callable       # Text of element with stripped parts
+    raw_text: Callable   # Text of element as it is
+    total_table: Callable       # Total table of page or None
+    facility_headers: Callable  # Header tables of facilities
+    facility_datas: Callable    # Capacity tables of facilities
+
+
+BS4 = Tree(
+    rows=lambda table: table.find_all('tr'),
+    cells=lambda row: row.find_all(['th', 'td']),
+    th=lambda row: row.find_all('th'),
+    td=lambda row: row.find_all('td'),
+    divs=lambda row: row.find_all('div'),
+    text=lambda element: element.get_text(strip=True),
+    raw_text=lambda element: element.get_text(),
+    total_table=lambda bs: (
+        bs.find('table', {'class': 'lic-tez-total-table'})
+        or
+        bs.find('table', {'id': 'lic-tez-total-table'})
+        ),
+    facility_headers=lambda bs: bs.find_all('table', {'class': 'lic-tez-header-table'}),
+    facility_datas=lambda bs: bs.find_all('table', {'class': 'lic-tez-data-table'}),
+)
+
+
+def build_capacity(table, tree: Tree) -> dict:
     """Parse table with data about installed capacity.
     """
     d = {}
-    for row in table.find_all('tr')[2:]:  # První dva řádky nemají hodnoty
-        # k = prepare_key(row.find('th').get_text())
-        k = row.find('th').get_text().strip('\n\t')
+    for row in tree.rows(table)[2:]:  # První dva řádky nemají hodnoty
+        k = tree.raw_text(tree.th(row)[0]).strip('\n\t')
 
-        # num_columns = len(row.find_all('td'))
-        num_columns = len(row.find_all(['th', 'td']))
+        vykony = tree.cells(row)
 
-        if num_columns == 3:
-            vykony = row.find_all(['th', 'td'])
-            el = vykony[-2].get_text(strip=True).replace(' ', '')
-            tep = vykony[-1].get_text(strip=True).replace(' ', '')
+        if len(vykony) == 3:
+            el = tree.text(vykony[-2]).replace(' ', '')
+            tep = tree.text(vykony[-1]).replace(' ', '')
             d[(k, 'Elektrický')] = float(el) if el else None
             d[(k, 'Tepelný')] = float(tep) if tep else None
         else:
             # Case when data in the row are not capacities
             # Počet zdrojů, Tok or Říční km
-            v = row.find('td')
-            d[k] = v.get_text(strip=True)
+            d[k] = tree.text(tree.td(row)[0])
     return d
 
 
-def parse_facility_header(tabulka: bs4.element.Tag) -> dict:
+def build_facility_header(tabulka, tree: Tree) -> dict:
     """Parse metadata about facility from html table.
     """
     d = {}
 
-    rows = tabulka.find_all('tr')
-    divs = rows[0].find_all('div')
-    d['id'] = int(divs[0].get_text(strip=True).strip('Evidenční číslo: '))
-    d['nazev'] = divs[1].get_text(strip=True)
+    rows = tree.rows(tabulka)
+    divs = tree.divs(rows[0])
+    d['id'] = int(tree.text(divs[0]).strip('Evidenční číslo: '))
+    d['nazev'] = tree.text(divs[1])
 
     soucasti_adresy = ('psc', 'obec', 'ulice', 'cp', 'okres', 'kraj')
     try:
-        adresa = divs[2].get_text(strip=True)
-        rozdelena_adresa = address.rozdel_adresu(address.uprav_adresu(adresa))
+        adresa = tree.text(divs[2])
+        rozdelena_adresa = address.zpracuj_adresu(adresa)
         for k, v in zip(soucasti_adresy, rozdelena_adresa):
             d[k] = v
     # Adresa schází
@@ -183,35 +314,23 @@ def parse_facility_header(tabulka: bs4.element.Tag) -> dict:
         d.update({soucast: None for soucast in soucasti_adresy})
 
     if len(rows) > 2:  # Neschází informace o katastru
-        for th, td in zip(rows[1].find_all('th'), rows[2].find_all('td')):
-            d[prepare_key(th.get_text(strip=True))] = td.get_text(strip=True)
+        for th, td in zip(tree.th(rows[1]), tree.td(rows[2])):
+            d[prepare_key(tree.text(th))] = tree.text(td)
 
     return d
 
 
-def prepare_key(original):
-    """Make the variable from the first column more useful.
-    """
-    normalizovane = unicodedata.normalize('NFD', original)
-    nove = normalizovane.encode('ascii', 'ignore').decode('utf-8')
-    return nove.strip().lower().replace(' ', '_')
-
-
-def parse_page(business: str, lic_id: str, bs: bs4.BeautifulSoup) -> Licence:
-    """Parse license page.
+def build_licence(business: str, lic_id: str, page, tree: Tree) -> Licence:
+    """Parse license page with lookups of the backend.
     """
 
     lic = Licence(id=lic_id, predmet=business)
 
     # Rozsah podnikání a technické podmínky
-    lic_tez_total_table = (
-        bs.find('table', {'class': 'lic-tez-total-table'})
-        or
-        bs.find('table', {'id': 'lic-tez-total-table'})
-        )
+    lic_tez_total_table = tree.total_table(page)
 
-    if lic_tez_total_table:  # Zrušené, zaniklé licence nemají výkony
-        lic_capacity = parse_capacity(lic_tez_total_table)
+    if lic_tez_total_table is not None:  # Zrušené, zaniklé licence nemají výkony
+        lic_capacity = build_capacity(lic_tez_total_table, tree)
 
         # Zpracuje výkony pro licenci
         for k, v in lic_capacity.items():
@@ -227,21 +346,20 @@ def parse_page(business: str, lic_id: str, bs: bs4.BeautifulSoup) -> Licence:
                 lic.pocet_zdroju = int(v)
 
     # Seznam jednotlivých provozoven k licenci
-    # Údaje o provozovnách
-    fac_headers = bs.find_all('table', {'class': 'lic-tez-header-table'})
-    # Výkony provozoven
-    fac_datas = bs.find_all('table', {'class': 'lic-tez-data-table'})
+    # Údaje o provozovnách a jejich výkony
+    fac_headers = tree.facility_headers(page)
+    fac_datas = tree.facility_datas(page)
 
     for header, data in zip(fac_headers, fac_datas):
 
         # Zpracování metadat o provozovně
-        fac = parse_facility_header(header)
+        fac = build_facility_header(header, tree)
 
         fac['lic_id'] = lic_id
         facility = Provozovna(**fac)
 
         # Zpracování výkonů k provozovně
-        fac_capacity = parse_capacity(data)
+        fac_capacity = build_capacity(data, tree)
 
         for k, v in fac_capacity.items():
             if len(k) == 2 and ((isinstance(v, float)) and (v > 0)):
@@ -261,12 +379,39 @@ def parse_page(business: str, lic_id: str, bs: bs4.BeautifulSoup) -> Licence:
     return lic
 
 
+def parse_capacity(table: 'bs4.BeautifulSoup') -> dict:
+    """Parse table with data about installed capacity.
+    """
+    return build_capacity(table, BS4)
+
+
+def parse_facility_header(tabulka: 'bs4.element.Tag') -> dict:
+    """Parse metadata about facility from html table.
+    """
+    return build_facility_header(tabulka, BS4)
+
+
+@lru_cache(maxsize=1024)
+def prepare_key(original):
+    """Make the variable from the first column more useful.
+    """
+    normalizovane = unicodedata.normalize('NFD', original)
+    nove = normalizovane.encode('ascii', 'ignore').decode('utf-8')
+    return nove.strip().lower().replace(' ', '_')
+
+
+def parse_page(business: str, lic_id: str, bs: 'bs4.BeautifulSoup') -> Licence:
+    """Parse license page.
+    """
+    return build_licence(business, lic_id, bs, BS4)
+
+
 if __name__ == '__main__':
     plana = Path('samples/cenergyplana.html')
     plzen = Path('samples/plzen.html')
     oleska = Path('samples/oleska.html')
 
     with open(oleska) as f:
-        bs = BeautifulSoup(f, 'html.parser')
+        bs = make_soup(f.read())
     lic = parse_page('110100010', bs)
     print(lic)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+"""Streaming pipeline fetch -> parse -> write.
+
+Every stage runs in its own thread and passes items to the next one
+through a bounded queue. When a later stage falls behind, the earlier
+one waits, so only a few pages and licences are held in memory at once
+no matter how many licences are requested.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from configparser import Error
+from functools import partial
+from typing import Callable, Iterable, Iterator, Sequence, Tuple
+
+from common import metrics
+from common.limiter import AdaptiveLimiter
+from licenses import address, parse
+from licenses.cache import PageCache
+
+
+QUEUE_SIZE = 100
+
+_DONE = object()
+
+
+class _Failure:
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def threaded(
+    iterable: Iterable, maxsize: int = QUEUE_SIZE, name: str = None,
+        ) -> Iterator:
+    """Iterate iterable in a background thread through a bounded queue.
+
+    Exception raised in the background thread is raised again
+    in the consumer. With name the depth of the queue is recorded
+    as gauge queue_depth{stage=name}.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+        else:
+            put(_DONE)
+        finally:
+            # Stop also the stages feeding this one
+            close = getattr(iterable, 'close', None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = items.get()
+            if name:
+                metrics.set_gauge('queue_depth', items.qsize(), stage=name)
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def parse_content(
+    business: str, lic_id: str, content: bytes, backend: str = 'bs4'
+        ) -> parse.Licence:
+    """Parse raw page with selected backend, runs also in worker processes.
+    """
+    return timed_parse(business, lic_id, content, backend)[0]
+
+
+def timed_parse(
+    business: str, lic_id: str, content: bytes, backend: str = 'bs4'
+        ) -> Tuple[parse.Licence, float, float]:
+    """Parse raw page, return licence and seconds of decoding and parsing.
+
+    Worker processes do not share metrics, so the times are returned
+    and recorded by the main process.
+    """
+    start = time.perf_counter()
+    if backend == 'lxml':
+        from licenses import parse_lxml
+        doc = parse_lxml.make_tree(content)
+        parsed = time.perf_counter()
+        lic = parse_lxml.parse_page(business, lic_id, doc)
+    else:
+        doc = parse.make_soup(content)
+        parsed = time.perf_counter()
+        lic = parse.parse_page(business, lic_id, doc)
+    return lic, parsed - start, time.perf_counter() - parsed
+
+
+def _record_parse(result: Tuple[parse.Licence, float, float]) -> parse.Licence:
+    lic, decode_seconds, parse_seconds = result
+    metrics.observe('decode_seconds', decode_seconds)
+    metrics.observe('parse_seconds', parse_seconds)
+    if lic.provozovny:
+        metrics.observe(
+            'parse_seconds_per_facility', parse_seconds / len(lic.provozovny),
+            )
+    metrics.inc('parsed_total')
+    metrics.inc('parsed_facilities_total', len(lic.provozovny))
+    return lic
+
+
+def _parse_results(
+    business: str, pages: Iterable, workers: int, backend: str,
+        ) -> Iterator[Tuple[str, Callable[[], Tuple]]]:
+    """Yield (lic_id, function returning result of timed_parse) in order of pages.
+
+    With more workers pages are parsed in a process pool. Only raw bytes
+    are sent to the workers and parsed licences sent back, at most
+    2 * workers pages are waiting in the pool.
+    """
+    if workers <= 1:
+        for lic_id, content in pages:
+            yield lic_id, partial(
+                timed_parse, business, lic_id, content, backend,
+                )
+        return
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Pages are fetched in other threads, do not fork them into workers
+    context = multiprocessing.get_context('spawn')
+    # Workers start fresh, they need the same PSČ table
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context,
+        initializer=address.use_psc_index, initargs=(address.psc_paths(),),
+            ) as executor:
+        pending = deque()
+        for lic_id, content in pages:
+            pending.append((
+                lic_id,
+                executor.submit(
+                    timed_parse, business, lic_id, content, backend,
+                    ),
+                ))
+            if len(pending) >= 2 * workers:
+                lic_id, future = pending.popleft()
+                yield lic_id, future.result
+        while pending:
+            lic_id, future = pending.popleft()
+            yield lic_id, future.result
+
+
+def parse_pages(
+    business: str, lic_ids: Iterable, pages: Iterable, workers: int = 1,
+    backend: str = 'bs4',
+        ) -> Iterator[parse.Licence]:
+    count = 0
+
+    results = _parse_results(business, pages, workers, backend)
+    for lic_id, result in results:
+        try:
+            yield _record_parse(result())
+        except Error as e:
+            print(e)
+            print(f'Error occured when parsing id {lic_id}')
+            if isinstance(lic_ids, Sequence):
+                print(f'for {business} at index {lic_ids.index(lic_id)}')
+            else:
+                print(f'for {business}, licence number {count + 1}')
+            raise SystemExit
+
+        count += 1
+        if count % 500 == 0:
+            print(f'Parsed {count} licenses')
+
+
+def stream(
+    business: str, lic_ids: Iterable, url: str, start: int = 0, end: int = None,
+    concurrency: int = 1, cache: PageCache = None,
+    maxsize: int = QUEUE_SIZE, parse_workers: int = 1, backend: str = 'bs4',
+    limiter: AdaptiveLimiter = None,
+        ) -> Iterator[parse.Licence]:
+    """Yield parsed licences as soon as their pages are fetched and parsed.
+
+    lic_ids can be also an iterator, e.g. of ids parsed from holders xml,
+    pages are then requested while the ids are still coming.
+    """
+    # asyncio is imported only by commands which download pages
+    from licenses import fetch
+
+    if isinstance(lic_ids, Sequence):
+        ids = lic_ids[start:end]
+    else:
+        ids = itertools.islice(lic_ids, start, end)
+    pages = threaded(
+        fetch.iter_pages(url, ids, concurrency, cache, limiter),
+        maxsize,
+        'fetch',
+        )
+    return threaded(
+        parse_pages(business, lic_ids, pages, parse_workers, backend),
+        maxsize,
+        'parse',
+        )
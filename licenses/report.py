@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+"""Installed capacity reports over exported licences.
+
+CapacityStore keeps capacities of facilities in numpy arrays:
+codes of technologie and druh, float64 MW and index of the facility,
+facilities have codes of kraj and okres and index of the licence.
+Totals, percentiles and top facilities are then computed with
+vectorized group-bys instead of a loop over csv rows.
+
+Requires numpy.
+"""
+
+import csv
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from licenses.output import open_csv
+from licenses.parse import Licence
+
+
+TOTAL = 'Celkový'
+
+
+class _Codes:
+    """Dictionary encoding of one string column.
+    """
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._codes: Dict[Optional[str], int] = {}
+
+    def __call__(self, value: Optional[str]) -> int:
+        if value == '':
+            value = None
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def get(self, value: Optional[str]) -> int:
+        return self._codes.get(value, -1)
+
+
+class CapacityStore:
+
+    def __init__(self):
+        self.technologie = _Codes()
+        self.druh = _Codes()
+        self.kraj = _Codes()
+        self.okres = _Codes()
+        self.lic_ids = _Codes()
+
+        # Capacities
+        self.cap_technologie = np.empty(0, dtype=np.int32)
+        self.cap_druh = np.empty(0, dtype=np.int32)
+        self.cap_mw = np.empty(0, dtype=np.float64)
+        self.cap_facility = np.empty(0, dtype=np.int32)
+
+        # Facilities
+        self.fac_id = np.empty(0, dtype=np.int64)
+        self.fac_licence = np.empty(0, dtype=np.int32)
+        self.fac_kraj = np.empty(0, dtype=np.int32)
+        self.fac_okres = np.empty(0, dtype=np.int32)
+        self.fac_nazev: List[str] = []
+
+    @classmethod
+    def from_rows(
+        cls, facilities: Iterable[dict], capacities: Iterable[dict]
+            ) -> 'CapacityStore':
+        """Build store from rows of facilities and facilities capacities.
+        """
+        store = cls()
+
+        fac_index = {}
+        fac_id, fac_licence, fac_kraj, fac_okres = [], [], [], []
+        for row in facilities:
+            key = (row['lic_id'], str(row['id']))
+            fac_index[key] = len(fac_id)
+            fac_id.append(int(row['id']))
+            fac_licence.append(store.lic_ids(row['lic_id']))
+            fac_kraj.append(store.kraj(row['kraj']))
+            fac_okres.append(store.okres(row['okres']))
+            store.fac_nazev.append(row['nazev'])
+
+        cap_technologie, cap_druh, cap_mw, cap_facility = [], [], [], []
+        for row in capacities:
+            facility = fac_index.get((row['lic_id'], str(row['provozovna_id'])))
+            if facility is None:
+                continue
+            cap_technologie.append(store.technologie(row['technologie']))
+            cap_druh.append(store.druh(row['druh']))
+            cap_mw.append(row['mw'])
+            cap_facility.append(facility)
+
+        store.fac_id = np.array(fac_id, dtype=np.int64)
+        store.fac_licence = np.array(fac_licence, dtype=np.int32)
+        store.fac_kraj = np.array(fac_kraj, dtype=np.int32)
+        store.fac_okres = np.array(fac_okres, dtype=np.int32)
+        store.cap_technologie = np.array(cap_technologie, dtype=np.int32)
+        store.cap_druh = np.array(cap_druh, dtype=np.int32)
+        store.cap_mw = np.array(cap_mw, dtype=np.float64)
+        store.cap_facility = np.array(cap_facility, dtype=np.int32)
+        return store
+
+    @classmethod
+    def from_licences(cls, licences: Iterable[Licence]) -> 'CapacityStore':
+        facilities, capacities = [], []
+        for lic in licences:
+            for fac in lic.provozovny:
+                facilities.append(fac.__dict__)
+                capacities.extend(cap.__dict__ for cap in fac.vykony)
+        return cls.from_rows(facilities, capacities)
+
+    @classmethod
+    def from_csv(cls, output_dir: Path) -> 'CapacityStore':
+        """Build store from csvs exported to output_dir (also .csv.gz).
+        """
+        output_dir = Path(output_dir)
+
+        def path(filename):
+            plain = output_dir / filename
+            return plain if plain.exists() else output_dir / (filename + '.gz')
+
+        with open_csv(path('facilities.csv')) as fac_csv, \
+                open_csv(path('facilities_capacities.csv')) as cap_csv:
+            return cls.from_rows(csv.DictReader(fac_csv), csv.DictReader(cap_csv))
+
+    def _selection(self, druh: str, technologie: str = None) -> np.ndarray:
+        mask = self.cap_druh == self.druh.get(druh)
+        if technologie is not None:
+            mask &= self.cap_technologie == self.technologie.get(technologie)
+        return mask
+
+    def installed(
+        self, druh: str = 'Elektrický',
+        by: Sequence[str] = ('technologie', 'kraj', 'okres'),
+            ) -> List[Tuple]:
+        """Installed MW grouped by columns in by, largest first.
+
+        Each item is a tuple of group values followed by MW. Without
+        technologie in by, groups sum the total rows of facilities,
+        otherwise the rows of single technologies.
+        """
+        if 'technologie' in by:
+            mask = self._selection(druh)
+            mask &= self.cap_technologie != self.technologie.get(TOTAL)
+        else:
+            mask = self._selection(druh, TOTAL)
+        facility = self.cap_facility[mask]
+        columns = {
+            'technologie': (self.cap_technologie[mask], self.technologie),
+            'kraj': (self.fac_kraj[facility], self.kraj),
+            'okres': (self.fac_okres[facility], self.okres),
+        }
+
+        # Combine codes of all columns into one integer key
+        key = np.zeros(mask.sum(), dtype=np.int64)
+        for name in by:
+            codes, encoding = columns[name]
+            key = key * max(len(encoding.values), 1) + codes
+
+        groups, inverse = np.unique(key, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.cap_mw[mask])
+
+        result = []
+        for group, total in zip(groups, totals):
+            values = []
+            for name in reversed(by):
+                encoding = columns[name][1]
+                size = max(len(encoding.values), 1)
+                values.append(encoding.values[group % size])
+                group //= size
+            result.append((*reversed(values), float(total)))
+        return sorted(result, key=lambda item: item[-1], reverse=True)
+
+    def facility_totals(self, druh: str = 'Elektrický') -> np.ndarray:
+        """Total installed MW of every facility.
+        """
+        mask = self._selection(druh, TOTAL)
+        return np.bincount(
+            self.cap_facility[mask], weights=self.cap_mw[mask],
+            minlength=len(self.fac_id),
+            )
+
+    def percentiles(
+        self, druh: str = 'Elektrický', q: Sequence[float] = (50, 90, 99)
+            ) -> Dict[float, float]:
+        """Percentiles of total MW of facilities with some capacity.
+        """
+        totals = self.facility_totals(druh)
+        totals = totals[totals > 0]
+        if not len(totals):
+            return {}
+        return dict(zip(q, np.percentile(totals, q).tolist()))
+
+    def top(self, n: int = 10, druh: str = 'Elektrický') -> List[Tuple]:
+        """Facilities with the largest total MW as (lic_id, id, nazev, kraj, MW).
+        """
+        totals = self.facility_totals(druh)
+        n = min(n, len(totals))
+        if not n:
+            return []
+        largest = np.argpartition(-totals, n - 1)[:n]
+        largest = largest[np.argsort(-totals[largest], kind='stable')]
+        return [
+            (
+                self.lic_ids.values[self.fac_licence[i]],
+                int(self.fac_id[i]),
+                self.fac_nazev[i],
+                self.kraj.values[self.fac_kraj[i]],
+                float(totals[i]),
+            )
+            for i in largest
+            ]
+
+
+def print_report(store: CapacityStore, druh: str, top: int) -> None:
+    print(f'Installed capacity ({druh}) by technologie, kraj and okres [MW]')
+    for technologie, kraj, okres, mw in store.installed(druh):
+        print(f'{technologie or "-":<24}{kraj or "-":<24}{okres or "-":<28}{mw:>14.3f}')
+
+    print(f'\nPercentiles of facility capacity ({druh}) [MW]')
+    for q, mw in store.percentiles(druh).items():
+        print(f'p{q:<8g}{mw:>14.3f}')
+
+    print(f'\nTop {top} facilities ({druh}) [MW]')
+    for lic_id, fac_id, nazev, kraj, mw in store.top(top, druh):
+        print(f'{lic_id:<12}{fac_id:<6}{nazev or "-":<40}{kraj or "-":<24}{mw:>14.3f}')
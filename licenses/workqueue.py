@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+"""Work queue of licence ids shared by workers on several machines.
+
+The coordinator splits licence ids into shards stored in a SQLite
+database (no broker needed, only a file all workers can reach).
+A worker claims a shard with a lease, renews the lease while it works
+and marks the shard done when its output is complete. Shards whose
+lease expired, e.g. because the worker died, are claimed again.
+
+Every worker writes its own output, csvs of shard N done by worker W
+are in <output_dir>/shards/<W>/<N>. Shard directory is renamed into
+place only when complete, merge then joins the shards recorded as
+done into the usual four csvs.
+"""
+
+import csv
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from common import csvindex, db
+from licenses.output import ID_COLUMNS, CsvWriter, open_csv
+from licenses.parse import Licence
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    business TEXT NOT NULL,
+    lic_ids TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (status, lease_until);
+'''
+
+SHARD_SIZE = 500
+LEASE = 600.0
+# Seconds to wait for the database locked by another worker
+TIMEOUT = 60.0
+
+
+@dataclass
+class Shard:
+    id: int
+    business: str
+    lic_ids: List[str]
+    attempts: int
+
+
+def default_worker() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class WorkQueue:
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = path
+        # Rollback journal, the database may be on a shared filesystem
+        self.conn = db.connect(
+            path, SCHEMA, wal=False, timeout=TIMEOUT, check_same_thread=False,
+            )
+        # Lease is renewed from another thread
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> 'WorkQueue':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def enqueue(
+        self, business: str, lic_ids: Iterable[str], shard_size: int = SHARD_SIZE,
+            ) -> int:
+        """Split licence ids into shards, return number of shards.
+        """
+        ids = list(lic_ids)
+        rows = [
+            (business, json.dumps(ids[i:i + shard_size]))
+            for i in range(0, len(ids), shard_size)
+            ]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO shards (business, lic_ids) VALUES (?, ?)', rows,
+                )
+        return len(rows)
+
+    def claim(self, worker: str, lease: float = LEASE) -> Optional[Shard]:
+        """Lease the first pending shard or shard with expired lease.
+        """
+        now = time.time()
+        with self._lock:
+            # Write lock right away, two workers never claim the same shard
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute(
+                    "SELECT id, business, lic_ids, attempts FROM shards "
+                    "WHERE status = 'pending' "
+                    "OR (status = 'leased' AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,),
+                    ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE shards SET status = 'leased', worker = ?, "
+                        "lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        (worker, now + lease, row[0]),
+                        )
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+
+        if row is None:
+            return None
+        return Shard(row[0], row[1], json.loads(row[2]), row[3] + 1)
+
+    def renew(self, shard: Shard, worker: str, lease: float = LEASE) -> bool:
+        """Extend the lease, False if the shard is no longer leased by worker.
+        """
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE shards SET lease_until = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + lease, shard.id, worker),
+                )
+        return cursor.rowcount == 1
+
+    def complete(self, shard: Shard, worker: str) -> bool:
+        """Mark shard done, False if the lease was lost in the meantime.
+        """
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE shards SET status = 'done', lease_until = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (shard.id, worker),
+                )
+        return cursor.rowcount == 1
+
+    def progress(self, business: str = None) -> Dict[str, int]:
+        """Number of shards by status.
+        """
+        sql = 'SELECT status, COUNT(*) FROM shards'
+        params = ()
+        if business:
+            sql += ' WHERE business = ?'
+            params = (business,)
+        with self._lock:
+            return dict(self.conn.execute(sql + ' GROUP BY status', params))
+
+    def done(self, business: str) -> List[tuple]:
+        """(shard id, worker) of shards done for business.
+        """
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, worker FROM shards "
+                "WHERE business = ? AND status = 'done' ORDER BY id",
+                (business,),
+                ).fetchall()
+
+
+def shard_dir(output_dir: Path, worker: str, shard_id: int) -> Path:
+    return Path(output_dir) / 'shards' / worker / f'{shard_id:06d}'
+
+
+def _heartbeat(
+    queue: WorkQueue, shard: Shard, worker: str, lease: float,
+    stop: threading.Event, lost: threading.Event,
+        ) -> None:
+    while not stop.wait(lease / 3):
+        if not queue.renew(shard, worker, lease):
+            lost.set()
+            return
+
+
+def run_worker(
+    queue: WorkQueue, worker: str,
+    stream: Callable[[Shard], Iterator[Licence]],
+    output_dir: Callable[[Shard], Path],
+    lease: float = LEASE, poll: float = 5.0,
+        ) -> int:
+    """Process shards until the queue is empty, return number of shards.
+
+    stream returns parsed licences of a shard, output_dir the directory
+    with shards of its business. While shards leased by other workers
+    remain, the worker waits in case their leases expire.
+    """
+    processed = 0
+    while True:
+        shard = queue.claim(worker, lease)
+        if shard is None:
+            if queue.progress().get('leased'):
+                time.sleep(poll)
+                continue
+            return processed
+
+        print(f'Shard {shard.id}: {len(shard.lic_ids)} licenses, attempt {shard.attempts}')
+        target = shard_dir(output_dir(shard), worker, shard.id)
+        tmp = target.with_name(target.name + '.tmp')
+        shutil.rmtree(tmp, ignore_errors=True)
+
+        stop, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(queue, shard, worker, lease, stop, lost),
+            daemon=True,
+            )
+        heartbeat.start()
+        try:
+            with CsvWriter(tmp) as writer:
+                for lic in stream(shard):
+                    writer.write(lic)
+                    if lost.is_set():
+                        break
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        if lost.is_set():
+            print(f'Lease of shard {shard.id} lost, output discarded')
+            shutil.rmtree(tmp, ignore_errors=True)
+            continue
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        if queue.complete(shard, worker):
+            processed += 1
+        else:
+            print(f'Lease of shard {shard.id} lost, output discarded')
+            shutil.rmtree(target, ignore_errors=True)
+
+
+def merge(queue: WorkQueue, business: str, output_dir: Path) -> int:
+    """Join csvs of done shards into the four csvs in output_dir.
+
+    Returns number of merged shards.
+    """
+    output_dir = Path(output_dir)
+    shards = queue.done(business)
+    if not shards:
+        print(f'No shards of {business} done yet, {queue.progress(business)}')
+        raise SystemExit
+    missing = [
+        str(shard_dir(output_dir, worker, shard_id)) for shard_id, worker in shards
+        if not shard_dir(output_dir, worker, shard_id).is_dir()
+        ]
+    if missing:
+        print(f'Csvs of done shards are missing: {", ".join(missing)}')
+        raise SystemExit
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for cls, filename in CsvWriter(output_dir).filenames.items():
+        with open_csv(output_dir / filename, 'w') as out:
+            csv.writer(out).writerow(cls.columns())
+            for shard_id, worker in shards:
+                with open_csv(shard_dir(output_dir, worker, shard_id) / filename) as f:
+                    f.readline()  # Header
+                    shutil.copyfileobj(f, out)
+        csvindex.build(output_dir / filename, ID_COLUMNS[cls])
+
+    return len(shards)
@@ -3,10 +3,15 @@ from setuptools import setup
 setup(
     name='holders',
     version='0.0.1',
-    packages=['holders', 'licenses'],
+    packages=['common', 'holders', 'licenses'],
     install_requires=[
         'requests',
     ],
+    extras_require={
+        'lxml': ['lxml'],
+        'numpy': ['numpy'],
+        'parquet': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'holders = holders.main:main',
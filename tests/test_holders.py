@@ -1,7 +1,8 @@
 import datetime
+import io
 import pathlib
 import pytest
-from holders.config import conf
+from holders.config import get_config
 
 
 from holders import main
@@ -17,7 +18,200 @@ test_subject = main.Holder(
 
 
 def test_parse_electricity_xml_from_file():
-    xml = pathlib.Path('samples') / conf.get('samples', 'electricity')
+    xml = pathlib.Path('samples') / get_config().get('samples', 'electricity')
     result = main.parse_xml(xml, 'výroba elektřiny')
     assert result[0] == test_subject
 
+
+
+def make_xml(count, encoding='windows-1250'):
+    """Holders xml with count licences in the format of eru.cz
+    """
+    attrs = {orig_key: '' for orig_key in main.translation}
+    attrs.update({
+        'version': '18', 'version_status': 'Aktivní verze',
+        'subjekt_nazev': 'Povodí Vltavy, státní podnik',
+        'subjekt_okres': '----------', 'subjekt_den_opravneni': '2001-07-01',
+        'odpovedny_zast': 'Yvona Křáková',
+    })
+    rows = []
+    for i in range(count):
+        attrs['cislo_licence'] = str(110100000 + i)
+        rows.append('<licence ' + ' '.join(f'{k}="{v}"' for k, v in attrs.items()) + '/>')
+    xml = f'<?xml version="1.0" encoding="{encoding}"?>\n<licences>\n' + '\n'.join(rows) + '\n</licences>'
+    return xml.encode('cp1250')
+
+
+def test_iter_xml_streams_holders(monkeypatch):
+    monkeypatch.setattr(main, 'CHUNK_SIZE', 100)
+    stream = io.BytesIO(make_xml(50))
+
+    holders = main.iter_xml(stream, 'výroba elektřiny')
+    first = next(holders)
+
+    assert stream.tell() < len(stream.getvalue())
+    assert first.id == '110100000'
+    assert first.version == 18
+    assert first.osoba == 'Yvona Křáková'
+    assert first.okres is None
+    assert first.den_opravneni == datetime.date(2001, 7, 1)
+    assert first.predmet == 'výroba elektřiny'
+    assert len(list(holders)) == 49
+
+
+def test_interrupted_download_keeps_previous_csv(tmp_path, monkeypatch):
+    from unittest.mock import MagicMock
+    from urllib3.exceptions import ProtocolError
+
+    class Dropped(io.BytesIO):
+        def read(self, size=-1):
+            data = super().read(size)
+            if not data:
+                raise ProtocolError('Connection broken')
+            return data
+
+    # Body ends in the middle of the xml
+    response = MagicMock()
+    response.raw = Dropped(make_xml(50)[:-500])
+    response.encoding = 'cp1250'
+
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'csvs/holders/electricity/holders.csv'
+    path.parent.mkdir(parents=True)
+    assert main.write_csv([test_subject], path) == 1
+    previous = path.read_bytes()
+
+    with pytest.raises(SystemExit):
+        main.export('electricity', response, {
+            'parquet': None, 'sqlite': None, 'csv': True, 'output': 'holders.csv',
+            })
+    assert path.read_bytes() == previous
+    assert not path.with_name('holders.csv.tmp').exists()
+
+
+def test_iter_xml_with_encoding_override():
+    # Encoding in declaration is wrong as with Response.text before
+    stream = io.BytesIO(make_xml(3, encoding='utf-8'))
+
+    holders = list(main.iter_xml(stream, 'výroba elektřiny', 'cp1250'))
+
+    assert holders[2].nazev == 'Povodí Vltavy, státní podnik'
+
+
+def test_holder_table():
+    pytest.importorskip('numpy')
+    from holders.table import HolderTable
+
+    holders = list(main.iter_xml(io.BytesIO(make_xml(20)), 'výroba elektřiny'))
+    holders[3].kraj = 'Plzeňský'
+    holders[5].version = None
+    table = HolderTable.from_holders(holders)
+
+    assert len(table) == 20
+    assert list(table.to_holders()) == holders
+    assert table[3].kraj == 'Plzeňský'
+    assert table[-1].id == '110100019'
+    assert len(table.categories['status']) == 1
+
+    plzen = table.filter(table.mask('kraj', 'Plzeňský'))
+    assert [row.id for row in plzen] == ['110100003']
+    assert table.mask('version', None).sum() == 1
+    assert table.mask('den_opravneni', datetime.date(2001, 7, 1)).all()
+
+
+def test_holder_table_from_csv():
+    pytest.importorskip('numpy')
+    from holders.table import HolderTable
+
+    table = HolderTable.from_csv('samples/sample_holders.csv')
+
+    assert len(table) == 10
+    assert table[0].to_holder() == test_subject
+    assert table.isin('status', ['Zaniklá', 'Zrušena']).sum() == 2
+    assert table.mask('version', None).sum() == 3
+
+
+def test_write_holders_to_sqlite(tmp_path):
+    from holders import db
+
+    holders = list(main.iter_xml(io.BytesIO(make_xml(30)), 'výroba elektřiny'))
+    holders[0].version = None
+
+    conn = db.connect(tmp_path / 'holders.db')
+    assert db.write_holders(conn, holders, batch_size=7) == 30
+    db.write_holders(conn, holders)
+
+    holders[1].version = 19
+    db.write_holders(conn, holders[:2])
+
+    assert conn.execute('SELECT COUNT(*) FROM holders').fetchone() == (31,)
+    assert conn.execute(
+        'SELECT den_opravneni FROM holders WHERE id = ?', ('110100000',)
+        ).fetchone() == ('2001-07-01',)
+
+
+def test_write_holders_to_parquet(tmp_path):
+    pytest.importorskip('pyarrow')
+    from common.parquet import read_dataset
+    from holders import parquet
+
+    holders = list(main.iter_xml(io.BytesIO(make_xml(10)), 'výroba elektřiny'))
+    holders[0].kraj = 'Plzeňský'
+
+    assert parquet.write_holders(holders, tmp_path, 'electricity', batch_size=4) == 10
+
+    table = read_dataset(tmp_path, filters=[('kraj', '=', 'Plzeňský')])
+    assert table.column('id').to_pylist() == ['110100000']
+    assert table.column('den_opravneni').to_pylist() == [datetime.date(2001, 7, 1)]
+
+
+def test_get_xml_from_local_server(tmp_path):
+    from benchmarks import corpus, server
+
+    corpus.write_corpus(tmp_path, 20, seed=1)
+    local = server.CorpusServer(
+        ('127.0.0.1', 0), tmp_path, server.Faults(latency=0),
+        )
+    server.serve_in_thread(local)
+    try:
+        # Link to xml on the index page is relative
+        xml = main.get_xml(local.url + server.INDEX_PATH, 'výroba elektřiny')
+        holders = main.parse_xml(xml, 'výroba elektřiny')
+    finally:
+        local.shutdown()
+        local.server_close()
+
+    assert len(holders) == 20
+    assert holders[0].id == corpus.lic_ids(1)[0]
+
+
+def test_export_all_from_local_server(tmp_path, monkeypatch):
+    from benchmarks import corpus, server
+
+    for count, business in enumerate(main.business_map, start=1):
+        corpus.write_corpus(tmp_path / 'corpus', count, business=business)
+    local = server.CorpusServer(
+        ('127.0.0.1', 0), tmp_path / 'corpus', server.Faults(latency=0),
+        )
+    server.serve_in_thread(local)
+    monkeypatch.chdir(tmp_path)
+    args = vars(main.get_parser().parse_args(['--business', 'all']))
+    try:
+        counts = main.export_all(args, local.url + server.INDEX_PATH)
+    finally:
+        local.shutdown()
+        local.server_close()
+
+    # Index page requested only once
+    assert local.stats['200'] == 1 + len(main.business_map)
+    assert counts == {
+        business: count for count, business in enumerate(main.business_map, start=1)
+        }
+    assert (tmp_path / 'csvs/holders/gas-trade/holders.csv').exists()
+
+    # Count from the index written next to the csv
+    from common import csvindex
+    from licenses.main import read_lic_count
+    with csvindex.CsvIndex.open(tmp_path / 'csvs/holders/gas-trade/holders.csv') as index:
+        assert index.rows == len(main.business_map)
+    assert read_lic_count('gas-trade') == len(main.business_map)
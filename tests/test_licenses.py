@@ -1,12 +1,19 @@
 import pathlib
 import os
 import csv
+import sqlite3
+import time
 from unittest.mock import patch
 
+import pytest
 from bs4 import BeautifulSoup
 
-from licenses import parse
-from licenses.main import read_lic_ids, read_lic_count
+from licenses import address, incremental, parse, pipeline
+from licenses.cache import PageCache
+from licenses.db import SqliteWriter
+from licenses.journal import JOURNAL, Journal, truncate
+from licenses.output import CsvWriter, open_csv
+from licenses.main import read_lic_ids, read_lic_count, get_data
 
 
 @patch('pathlib.Path')
@@ -145,3 +152,612 @@ def test_plzen_export_to_csv():
         pathlib.Path(f'{sub_path}/{csvfile}').unlink()
     pathlib.Path(f'{sub_path}').rmdir()
     pathlib.Path('tests/licenses').rmdir()
+
+
+# Minimal licence page with the same tables as on licence.eru.cz
+PAGE = '''<html><body>
+<table class="lic-tez-total-table">
+<tr><th>Rozsah</th></tr>
+<tr><th>Druh</th><th>Elektrický</th><th>Tepelný</th></tr>
+<tr><th>Celkový</th><td>1 200.500</td><td>30.000</td></tr>
+<tr><th>Parní</th><td>1 200.500</td><td></td></tr>
+<tr><th>Počet zdrojů</th><td>3</td></tr>
+</table>
+<table class="lic-tez-header-table">
+<tr><td><div>Evidenční číslo: 7</div><div>Elektrárna Test</div>
+<div>301 00\xa0Plzeň,\xa0Tylova\xa01/57,\xa0okres Plzeň-město,\xa0kraj Plzeňský</div>
+</td></tr>
+<tr><th>Katastrální území</th><th>Kód katastru</th><th>Vymezení</th></tr>
+<tr><td>Plzeň</td><td>721981</td><td>areál</td></tr>
+</table>
+<table class="lic-tez-data-table">
+<tr><th>Rozsah</th></tr>
+<tr><th>Druh</th><th>Elektrický</th><th>Tepelný</th></tr>
+<tr><th>Celkový</th><td>1 200.500</td><td>30.000</td></tr>
+<tr><th>Parní</th><td>1 200.500</td><td>0.000</td></tr>
+<tr><th>Počet zdrojů</th><td>3</td></tr>
+</table>
+</body></html>'''
+
+
+def test_parse_page_inline():
+    result = parse.parse_page('výroba elektřiny', '1', parse.make_soup(PAGE))
+
+    assert result.pocet_zdroju == 3
+    assert [v.mw for v in result.vykony] == [1200.5, 30.0, 1200.5]
+    assert result.provozovny[0].id == 7
+    assert result.provozovny[0].obec == 'Plzeň'
+    assert result.provozovny[0].kraj == 'Plzeňský'
+    assert result.provozovny[0].kod_katastru == '721981'
+    assert len(result.provozovny[0].vykony) == 3
+
+
+@patch('licenses.parse.request_page')
+def test_get_data_concurrent_keeps_order(mock_request_page):
+    mock_request_page.return_value = PAGE
+    lic_ids = [str(i) for i in range(20)]
+
+    serial = get_data('výroba elektřiny', lic_ids, 'url', 2, 15)
+    concurrent = get_data(
+        'výroba elektřiny', lic_ids, 'url', 2, 15, concurrency=4,
+        )
+
+    assert [lic.id for lic in concurrent] == lic_ids[2:15]
+    assert concurrent == serial
+
+
+@patch('licenses.parse.request_page')
+def test_slow_page_does_not_stall_other_requests(mock_request_page):
+    from licenses import fetch
+
+    def request_page(url, count, params, cache, limiter):
+        # Every 8th page is slow
+        time.sleep(0.2 if count % 8 == 0 else 0.01)
+        return params['lic-id'].encode()
+
+    mock_request_page.side_effect = request_page
+    lic_ids = [str(i) for i in range(64)]
+
+    start = time.perf_counter()
+    pages = list(fetch.iter_pages('url', lic_ids, concurrency=8))
+    elapsed = time.perf_counter() - start
+
+    assert pages == [(lic_id, lic_id.encode()) for lic_id in lic_ids]
+    # Slow pages in order one after another would take 1.6 s
+    assert elapsed < 0.8
+
+
+def test_make_soup_from_bytes():
+    soup = parse.make_soup(PAGE.encode('utf-8'))
+    result = parse.parse_page('výroba elektřiny', '1', soup)
+
+    assert result.provozovny[0].nazev == 'Elektrárna Test'
+
+
+@patch('common.client.get')
+def test_request_page_revalidates_cached_page(mock_get, tmp_path):
+    cache = PageCache(tmp_path)
+    params = {'lic-id': '1'}
+
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.content = PAGE.encode('utf-8')
+    mock_get.return_value.headers = {'ETag': '"abc"'}
+    assert parse.request_page('url', 0, params, cache) == PAGE.encode('utf-8')
+
+    mock_get.return_value.status_code = 304
+    mock_get.return_value.content = b''
+    assert parse.request_page('url', 0, params, cache) == PAGE.encode('utf-8')
+    assert mock_get.call_args.kwargs['headers'] == {'If-None-Match': '"abc"'}
+
+    mock_get.reset_mock()
+    offline = PageCache(tmp_path, offline=True)
+    assert parse.request_page('url', 0, params, offline) == PAGE.encode('utf-8')
+    mock_get.assert_not_called()
+
+
+@patch('licenses.parse.backoff', return_value=0)
+@patch('common.client.get')
+def test_request_page_retries_throttled_request(mock_get, mock_backoff):
+    from unittest.mock import Mock
+    from common.limiter import AdaptiveLimiter
+
+    throttled = Mock(status_code=429, content=b'', headers={'Retry-After': '0'})
+    ok = Mock(status_code=200, content=PAGE.encode('utf-8'), headers={})
+    mock_get.side_effect = [throttled, ok]
+
+    limiter = AdaptiveLimiter(max_limit=8, retries=2)
+    assert parse.request_page('url', 0, {'lic-id': '1'}, limiter=limiter) == PAGE.encode('utf-8')
+    assert mock_get.call_count == 2
+    assert limiter.in_flight == 0
+
+    mock_get.side_effect = [throttled] * 3
+    with pytest.raises(SystemExit):
+        parse.request_page('url', 0, {'lic-id': '1'}, limiter=limiter)
+
+    # Error page is not returned as a licence without limiter either
+    mock_get.side_effect = [Mock(status_code=503, content=b'', headers={})]
+    with pytest.raises(SystemExit):
+        parse.request_page('url', 0, {'lic-id': '1'})
+
+
+def test_adaptive_limiter_aimd():
+    from common.limiter import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(max_limit=8, max_rps=50)
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(200, 0.01)
+    assert limiter.limit == 8
+    assert limiter.rate == 50
+
+    limiter.acquire()
+    limiter.release(503, 0.01)
+    assert limiter.limit == 4
+
+    # Additive increase after the first congestion
+    limiter.acquire()
+    limiter.release(200, 0.01)
+    assert 4 < limiter.limit < 5
+
+    # 429 right after responses completed at the same instant
+    from common.limiter import MIN_SAMPLES
+    limiter = AdaptiveLimiter(max_limit=8, max_rps=50)
+    limiter._completed.extend([100.0] * MIN_SAMPLES)
+    limiter._decrease(100.0, throttled=True)
+    assert limiter.rate == 25
+
+
+def test_incremental_plan_and_carry_forward(tmp_path):
+    sample_path = pathlib.Path('samples/sample_holders.csv')
+    output_dir = tmp_path / 'licenses'
+
+    changed, unchanged = incremental.plan(sample_path, output_dir)
+    assert len(changed) == 10
+    assert unchanged == set()
+
+    incremental.save_snapshot(sample_path, output_dir)
+
+    with open(sample_path) as csvf:
+        rows = list(csv.DictReader(csvf))
+    rows[0]['version'] = '19'
+    current = tmp_path / 'holders.csv'
+    with open(current, 'w') as csvf:
+        writer = csv.DictWriter(csvf, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows[:-1])
+
+    changed, unchanged = incremental.plan(current, output_dir)
+    assert changed == ['110100009']
+    assert len(unchanged) == 8
+
+    lic = parse.parse_page('výroba elektřiny', '110100032', parse.make_soup(PAGE))
+    lic.to_csv(output_dir)
+    incremental.carry_forward(output_dir, unchanged)
+
+    with open(output_dir / 'facilities.csv') as csvf:
+        assert list(csv.DictReader(csvf)) == []
+
+
+@pytest.mark.parametrize('output', [['--sqlite', 'x.db'], ['--parquet', 'x']])
+def test_incremental_only_with_csv_output(output, tmp_path, monkeypatch):
+    from licenses import main
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('sys.argv', ['licenses', '--incremental', *output])
+    with pytest.raises(SystemExit):
+        main.main()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('output', [['--sqlite', 'x.db'], ['--parquet', 'x']])
+def test_resume_only_with_csv_output(output, tmp_path, monkeypatch):
+    from licenses import main
+
+    # Journal of an earlier csv run
+    output_dir = tmp_path / 'csvs/licenses/electricity'
+    output_dir.mkdir(parents=True)
+    (output_dir / JOURNAL).write_text('{"id": "1", "sizes": {}}\n')
+    holders = tmp_path / 'csvs/holders/electricity/holders.csv'
+    holders.parent.mkdir(parents=True)
+    holders.write_text('id\n1\n2\n')
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('sys.argv', ['licenses', '--resume', '--dev', *output])
+    try:
+        with pytest.raises(SystemExit):
+            main.main()
+    finally:
+        # main set the PSČ index to the holders csv in tmp_path
+        address.use_psc_index(None)
+    assert not (tmp_path / output[1]).exists()
+
+
+def test_csv_writer_gzip(tmp_path):
+    lic = parse.parse_page('výroba elektřiny', '1', parse.make_soup(PAGE))
+
+    with CsvWriter(tmp_path, compress=True) as writer:
+        writer.write(lic)
+        writer.write(lic)
+
+    with open_csv(tmp_path / 'facilities_capacities.csv.gz') as csvf:
+        data = list(csv.DictReader(csvf))
+    assert len(data) == 6
+    assert data[0]['provozovna_id'] == '7'
+    assert data[0]['mw'] == '1200.5'
+
+    with open_csv(tmp_path / 'licenses.csv.gz') as csvf:
+        data = list(csv.DictReader(csvf))
+    assert list(data[0]) == ['id', 'predmet', 'pocet_zdroju']
+
+    # Compressed csvs have no index, rows of the licence are found anyway
+    from licenses.main import show_licenses
+    from licenses.output import read_licence
+    rows = read_licence(tmp_path, '1')
+    assert len(rows['facilities_capacities.csv']) == 6
+    assert show_licenses(tmp_path, '1', '9') == 1
+
+
+def test_threaded_is_bounded_and_reraises():
+    produced = []
+
+    def numbers():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+        raise ValueError('boom')
+
+    items = pipeline.threaded(numbers(), maxsize=5)
+    assert next(items) == 0
+    time.sleep(0.2)
+    assert len(produced) <= 7
+
+    with pytest.raises(ValueError):
+        list(items)
+
+
+@patch('licenses.parse.request_page')
+def test_stream_stops_on_error(mock_request_page):
+    mock_request_page.side_effect = [PAGE, SystemExit]
+
+    licences = pipeline.stream('výroba elektřiny', ['1', '2', '3'], 'url')
+    assert next(licences).id == '1'
+    with pytest.raises(SystemExit):
+        next(licences)
+
+
+def test_journal_truncates_partly_written_licence(tmp_path):
+    first = parse.parse_page('výroba elektřiny', '1', parse.make_soup(PAGE))
+    second = parse.parse_page('výroba elektřiny', '2', parse.make_soup(PAGE))
+
+    journal = Journal(tmp_path / 'journal.jsonl').open()
+    with CsvWriter(tmp_path) as writer, journal:
+        journal.record(None, writer.sizes())
+        writer.write(first)
+        journal.record(first.id, writer.sizes())
+        # Crash after rows of the second licence were only partly written
+        writer.write(second)
+        writer.flush()
+
+    done, sizes = Journal(tmp_path / 'journal.jsonl').read()
+    assert done == {'1'}
+
+    truncate(tmp_path, sizes)
+    with open(tmp_path / 'capacities.csv') as csvf:
+        data = list(csv.DictReader(csvf))
+    assert [row['lic_id'] for row in data] == ['1', '1', '1']
+
+
+def test_parse_pages_in_process_pool():
+    pages = [(str(i), PAGE.encode('utf-8')) for i in range(6)]
+    lic_ids = [lic_id for lic_id, _ in pages]
+
+    serial = list(pipeline.parse_pages('výroba elektřiny', lic_ids, pages))
+    pooled = list(pipeline.parse_pages(
+        'výroba elektřiny', lic_ids, pages, workers=2,
+        ))
+
+    assert pooled == serial
+
+
+# Total table identified by id, <td> instead of <th>, facility without address
+PAGE_INCONSISTENT = '''<html><body>
+<table id="lic-tez-total-table">
+<tr><th>Rozsah</th></tr>
+<tr><td>Druh</td><td>Elektrický</td><td>Tepelný</td></tr>
+<tr><th>Celkový <!-- výkon --></th><th>0.013</th><td></td></tr>
+<tr><th>Vodní</th><td>0.013</td><td></td></tr>
+<tr><th>Počet zdrojů</th><td> 2 </td></tr>
+</table>
+<table class="lic-tez-header-table wide">
+<tr><td><div>Evidenční číslo: 1</div><div> MVE <b>Oleška</b> </div></td></tr>
+<tr><th>Katastrální území</th><th>Kód katastru</th></tr>
+<tr><td>Oleška</td><td>670936</td></tr>
+</table>
+<table class="lic-tez-data-table">
+<tr><th>Rozsah</th></tr>
+<tr><th>Druh</th><th>Elektrický</th><th>Tepelný</th></tr>
+<tr><th>Vodní</th><td>0.013</td><td></td></tr>
+<tr><th>Tok</th><td>Oleška</td></tr>
+</table>
+</body></html>'''
+
+
+def read_page(name):
+    if name == 'PAGE':
+        return PAGE.encode('utf-8')
+    if name == 'PAGE_INCONSISTENT':
+        return PAGE_INCONSISTENT.encode('utf-8')
+    return pathlib.Path(f'samples/{name}').read_bytes()
+
+
+@pytest.mark.parametrize('name', [
+    'PAGE', 'PAGE_INCONSISTENT', 'plzen.html', 'oleska.html', 'cenergyplana.html',
+    ])
+def test_lxml_backend_equals_bs4(name):
+    pytest.importorskip('lxml')
+    content = read_page(name)
+
+    expected = pipeline.parse_content('výroba elektřiny', '1', content, 'bs4')
+    result = pipeline.parse_content('výroba elektřiny', '1', content, 'lxml')
+
+    assert result == expected
+
+
+def test_corpus_pages_parse_same_with_both_backends(tmp_path):
+    pytest.importorskip('lxml')
+    from benchmarks import corpus
+
+    xml_path, pages_dir = corpus.write_corpus(tmp_path, 200, seed=1)
+
+    facilities = 0
+    for page in sorted(pages_dir.iterdir()):
+        content = page.read_bytes()
+        expected = pipeline.parse_content('výroba elektřiny', page.stem, content, 'bs4')
+        assert pipeline.parse_content('výroba elektřiny', page.stem, content, 'lxml') == expected
+        facilities += len(expected.provozovny)
+
+    assert len(list(pages_dir.iterdir())) == 200
+    assert facilities > 200
+    assert corpus.write_corpus(tmp_path / 'again', 200, seed=1)[0].read_bytes() == xml_path.read_bytes()
+
+
+def test_sqlite_writer_is_idempotent(tmp_path):
+    lic = parse.parse_page('výroba elektřiny', '1', parse.make_soup(PAGE))
+    path = tmp_path / 'licenses.db'
+
+    for _ in range(2):
+        with SqliteWriter(path, batch_size=1) as writer:
+            writer.write(lic)
+
+    # Facility removed in a new version of the licence
+    lic.provozovny = []
+    with SqliteWriter(path) as writer:
+        writer.write(lic)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT COUNT(*) FROM licenses').fetchone() == (1,)
+    assert conn.execute('SELECT COUNT(*) FROM capacities').fetchone() == (3,)
+    assert conn.execute('SELECT COUNT(*) FROM facilities').fetchone() == (0,)
+    assert conn.execute(
+        'SELECT COUNT(*) FROM facilities_capacities'
+        ).fetchone() == (0,)
+
+
+def test_parquet_writer_partitions(tmp_path):
+    pytest.importorskip('pyarrow')
+    from common.parquet import read_dataset
+    from licenses.parquet import ParquetWriter
+
+    lic = parse.parse_page('výroba elektřiny', '1', parse.make_soup(PAGE))
+    with ParquetWriter(tmp_path, 'electricity', batch_size=1) as writer:
+        writer.write(lic)
+        writer.write(lic)
+
+    partition = tmp_path / 'facilities_capacities/business=electricity'
+    assert len(list(partition.glob('kraj=*/*.parquet'))) == 2
+
+    table = read_dataset(
+        tmp_path / 'facilities_capacities', columns=['kraj', 'mw'],
+        )
+    assert table.num_rows == 6
+    assert table.column('mw').to_pylist()[:2] == [1200.5, 30.0]
+    assert set(table.column('kraj').to_pylist()) == {'Plzeňský'}
+
+
+def test_capacity_store_report(tmp_path):
+    pytest.importorskip('numpy')
+    from licenses.report import CapacityStore
+
+    first = parse.parse_page('výroba elektřiny', '1', parse.make_soup(PAGE))
+    second = parse.parse_page('výroba elektřiny', '2', parse.make_soup(PAGE))
+    second.provozovny[0].okres = 'Plzeň-jih'
+    second.provozovny[0].vykony[0].mw = 100.0
+    with CsvWriter(tmp_path) as writer:
+        writer.write(first)
+        writer.write(second)
+
+    store = CapacityStore.from_csv(tmp_path)
+
+    assert sorted(store.installed()) == [
+        ('Parní', 'Plzeňský', 'Plzeň-jih', 1200.5),
+        ('Parní', 'Plzeňský', 'Plzeň-město', 1200.5),
+        ]
+    assert store.installed(by=('okres',))[-1] == ('Plzeň-jih', 100.0)
+    by_kraj = store.installed(by=('kraj',))
+    assert sum(mw for _, mw in by_kraj) == store.facility_totals().sum()
+    assert store.installed('Tepelný', by=('kraj',)) == [('Plzeňský', 60.0)]
+    assert store.percentiles(q=(50,)) == {50: 650.25}
+    assert [fac[0] for fac in store.top(1)] == ['1']
+
+
+ADRESY = [
+    '582 32\xa0Lipnice nad Sázavou,\xa0\n\t\tLipnice nad Sázavou,\xa0\n\t\tokres Havlíčkův Brod,\xa0\n\t\tkraj Vysočina',
+    '268 01\xa0Hořovice,\xa0\n\t\tKomenského\xa01245/7,\xa0\n\t\tokres Beroun',
+    '150 00\xa0Praha,\xa0\n\t\tHolečkova\xa03178/8,\xa0\n\t\t',
+    '339 01\xa0Klatovy',
+    ]
+
+
+def test_zpracuj_adresy():
+    index = address.load_psc_index(['samples/sample_holders.csv'])
+    assert index['15000'] == ('Praha', 'Hlavní město Praha', 'Hlavní město Praha')
+
+    # No table unless its csvs are given
+    assert address.psc_index() == {}
+    address.use_psc_index(['samples/sample_holders.csv'])
+    assert address.psc_index() == index
+
+    result = address.zpracuj_adresy(ADRESY + [ADRESY[0], None])
+
+    assert result[0] == ('58232', 'Lipnice nad Sázavou', 'Lipnice nad Sázavou', None, 'Havlíčkův Brod', 'Vysočina')
+    assert result[1] == ('26801', 'Hořovice', 'Komenského', '1245/7', 'Beroun', None)
+    assert result[2] == ('15000', 'Praha', 'Holečkova', '3178/8', 'Hlavní město Praha', 'Hlavní město Praha')
+    assert result[3:] == [None, result[0], None]
+    assert address.zpracuj_adresu.cache_info().hits == 1
+
+    address.use_psc_index(None)
+
+
+def test_metrics_of_parse_stage(tmp_path):
+    from common import metrics
+
+    metrics.registry.reset()
+    pages = [('1', PAGE.encode('utf-8')), ('2', PAGE_INCONSISTENT.encode('utf-8'))]
+    licences = list(pipeline.parse_pages('výroba elektřiny', ['1', '2'], pages))
+
+    snapshot = metrics.registry.snapshot()
+    assert snapshot['counters']['parsed_total'] == 2
+    assert snapshot['counters']['parsed_facilities_total'] == sum(
+        len(lic.provozovny) for lic in licences
+        )
+    assert snapshot['histograms']['parse_seconds']['count'] == 2
+
+    with metrics.Exporter(tmp_path / 'metrics.prom', interval=60):
+        pass
+    text = (tmp_path / 'metrics.prom').read_text()
+    assert '# TYPE decode_seconds histogram' in text
+    assert 'decode_seconds_bucket{le="+Inf"} 2' in text
+    assert 'parsed_total 2' in text
+
+
+def test_fused_stream_from_holders_xml(tmp_path):
+    pytest.importorskip('lxml')
+    from benchmarks import corpus, server
+    from licenses import fused
+
+    corpus.write_corpus(tmp_path / 'corpus', 30, seed=2)
+    local = server.CorpusServer(
+        ('127.0.0.1', 0), tmp_path / 'corpus', server.Faults(latency=0),
+        )
+    server.serve_in_thread(local)
+    holders_csv = tmp_path / 'holders' / 'holders.csv'
+    try:
+        ids = fused.holder_ids(
+            'electricity',
+            fused.holders_main.get_xml(local.url + server.INDEX_PATH, 'výroba elektřiny'),
+            holders_csv,
+            )
+        licences = list(pipeline.stream(
+            'výroba elektřiny', pipeline.threaded(ids), local.url + '/detail.php',
+            concurrency=4, backend='lxml',
+            ))
+    finally:
+        local.shutdown()
+        local.server_close()
+
+    assert [lic.id for lic in licences] == corpus.lic_ids(30)
+    with open(holders_csv) as csvf:
+        assert [row['id'] for row in csv.DictReader(csvf)] == corpus.lic_ids(30)
+
+
+def test_work_queue_leases_and_merge(tmp_path):
+    from licenses import workqueue
+
+    queue = workqueue.WorkQueue(tmp_path / 'queue.db')
+    assert queue.enqueue('electricity', [str(i) for i in range(5)], shard_size=2) == 3
+
+    # Worker which died holding a lease
+    dead = queue.claim('dead', lease=-1)
+    assert dead.lic_ids == ['0', '1']
+
+    def stream(shard):
+        for lic_id in shard.lic_ids:
+            yield parse.parse_page('výroba elektřiny', lic_id, parse.make_soup(PAGE))
+
+    output_dir = tmp_path / 'licenses'
+    assert workqueue.run_worker(queue, 'w1', stream, lambda shard: output_dir) == 3
+    assert queue.progress() == {'done': 3}
+    assert not queue.complete(dead, 'dead')
+
+    # Expired shard was done again by w1
+    assert queue.done('electricity') == [(1, 'w1'), (2, 'w1'), (3, 'w1')]
+
+    assert workqueue.merge(queue, 'electricity', output_dir) == 3
+    with open(output_dir / 'licenses.csv') as csvf:
+        assert [row['id'] for row in csv.DictReader(csvf)] == ['0', '1', '2', '3', '4']
+
+    # Nothing done for heat, no traceback
+    with pytest.raises(SystemExit):
+        workqueue.merge(queue, 'heat', tmp_path / 'missing')
+    queue.close()
+
+
+def test_startup_imports_no_heavy_modules(tmp_path):
+    import subprocess
+    import sys
+
+    code = (
+        'import sys, licenses.main; '
+        'print(" ".join(m for m in ("requests", "bs4", "asyncio") if m in sys.modules))'
+    )
+    # Fresh interpreter, modules imported by other tests do not count
+    env = dict(os.environ, PYTHONPATH=str(pathlib.Path.cwd()))
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=tmp_path, env=env,
+        capture_output=True, text=True, check=True,
+        )
+    assert result.stdout.split() == []
+
+    from common.config import get_config
+    assert get_config() is get_config()
+    assert get_config().get('licenses', 'url')
+
+
+def test_csv_index_lookup_range_and_count(tmp_path):
+    import random
+    from benchmarks import corpus
+    from common import csvindex
+    from licenses.output import read_licence
+
+    rng = random.Random(0)
+    ids = corpus.lic_ids(20)
+    lics = [
+        parse.parse_page('výroba elektřiny', lic_id, parse.make_soup(corpus.generate_page(lic_id, rng)))
+        for lic_id in ids
+        ]
+
+    # Second writer appends, only its rows are added to the index
+    with CsvWriter(tmp_path) as writer:
+        for lic in reversed(lics[:10]):
+            writer.write(lic)
+    with CsvWriter(tmp_path) as writer:
+        for lic in reversed(lics[10:]):
+            writer.write(lic)
+
+    with csvindex.CsvIndex.open(tmp_path / 'licenses.csv') as index:
+        assert len(index) == index.rows == 20
+        assert index.between(ids[3], ids[6]) == ids[3:7]
+        assert ids[5] in index and '1' not in index
+
+    lic = lics[7]
+    rows = read_licence(tmp_path, lic.id)
+    assert [row['id'] for row in rows['licenses.csv']] == [lic.id]
+    assert len(rows['facilities.csv']) == len(lic.provozovny)
+    assert [row['nazev'] for row in rows['facilities.csv']] == [fac.nazev for fac in lic.provozovny]
+    assert len(rows['capacities.csv']) == len(lic.vykony)
+
+    # to_csv appends without rebuilding the index, stale index is not used
+    lics[0].to_csv(tmp_path)
+    assert csvindex.CsvIndex.open(tmp_path / 'licenses.csv') is None
+    assert csvindex.count_rows(tmp_path / 'licenses.csv') == 21
+    assert len(read_licence(tmp_path, ids[0])['licenses.csv']) == 2